@@ -1,5 +1,6 @@
 from . import log
-from . import common, connection_manager, encryption, exceptions, features, shell
+from . import agent, async_actions, common, connection_manager, encryption, exceptions, features, http_pool, session_cache, shell
 from .common.config import list_credential_files
+from .async_actions import AsyncActions
 from .connection_manager import LogicHubConnection
-from .main import LogicHubCLI, LogicHubBulkCLI, list_all_instances
+from .main import LogicHubCLI, LogicHubBulkCLI, FanOutResult, list_all_instances
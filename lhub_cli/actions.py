@@ -1,27 +1,28 @@
 import lhub
 import time
 import os
+import csv
 from pathlib import Path
-from requests import HTTPError
 import json
-import base64
 import re
+from collections import Counter
 from .connection_manager import LogicHubConnection
+from .common.concurrency import CAPTURED_EXCEPTIONS, AdaptiveConcurrency, iter_completed
 from .common.output import print_fancy_lists
+from .common.rate_limit import get_rate_limiter, TokenBucket
+from .common.retry import RetryPolicy, get_retry_policy
+from .exceptions.app import CircuitOpen
+from .features.exporters import EXPORTERS, PlaybookExporter, ResourceExporter
+from .features.exports import ARCHIVE_FORMATS, ArchiveDestination, ContentStore, ExportArchive, ExportManifest, FolderDestination, StoreDestination, find_last_modified
 from numbers import Number
 from .log import generate_logger, ExpectedLoggerTypes
-from typing import Union
-
-# ToDo NEXT: Follow the same formula from "export_playbooks" to add support for exporting other resource types as well
-#  * custom lists
-#  * event types
-#  * commands
-#  * modules
-#  * custom integration
-#  * baselines
-#  * scripts (new, used in runScript)
+from typing import Iterable, Union
+
+BULK_UPDATE_LOG_HEADERS = ["case_id", "status", "attempts", "seconds", "error"]
+
+# ToDo Export resource types not yet covered by features.exporters:
+#  * scripts (new, used in runScript) - not exposed by lhub yet
 #  * scripts (legacy, if the process is different)
-#  * dashboards & widgets
 #  Features without an official export ability:
 #  * cases? Probably not, but maybe...
 
@@ -34,6 +35,11 @@ class Actions:
         self.__config = config
         self.__instance_name = instance_label
         self.__log = logger or generate_logger(name=__name__, instance_name=instance_label)
+        self.performance = config.performance
+        # Shared with every other job against the same server in this process, so combined throughput stays predictable
+        self.rate_limiter = get_rate_limiter(config.credentials.hostname, self.performance.rate_limit, self.performance.rate_burst)
+        # Retry budget and circuit breaker are shared the same way, so a dead instance fails fast for every job
+        self.retry_policy = get_retry_policy(config.credentials.hostname, self.performance, logger=self.__log)
 
     def __set_export_path(self, parent_folder, export_type):
         current_date = time.strftime("%Y-%m-%d")
@@ -48,65 +54,249 @@ class Actions:
                 break
         return parent_folder
 
-    def __save_export_to_disk(self, response, export_folder, resource_id, resource_name, file_info):
-        write_mode = "w"
-        content_b64 = response["result"]["contentB64"]
-        file_type = response["result"]["fileType"]
-        file_name = f"{resource_name}.{file_type}"
-        # Sanitize the name in case it contains illegal characters for a file name
-        file_name = re.sub(r'[^\w\-()\[\] +]', '_', file_name)
-        if file_type == "json":
-            decoded = base64.b64decode(content_b64).decode("utf-8")
-            file_data = json.dumps(json.loads(decoded), indent=4)
-        elif file_type == "zip":
-            write_mode = "wb"
-            file_data = base64.b64decode(content_b64)
+    def __set_archive_path(self, parent_folder, export_type, compression):
+        current_date = time.strftime("%Y-%m-%d")
+        Path(parent_folder).mkdir(parents=True, exist_ok=True)
+        _file_counter = 0
+        while True:
+            _file_counter += 1
+            _archive_path = os.path.join(parent_folder, f"{self.__lhub.api.url.server_name}_{export_type}_{current_date}_{_file_counter}_m{self.__lhub.api.version}.{ARCHIVE_FORMATS[compression]}")
+            if not os.path.exists(_archive_path):
+                return _archive_path
+
+    @staticmethod
+    def _export_error_messages(err: BaseException) -> list:
+        """Error messages for a failed export, read from the exception's own response (safe to use from worker threads)"""
+        response = getattr(err, "response", None)
+        if response is None:
+            return [getattr(err, "message", None) or str(err) or repr(err)]
+        try:
+            _response_message = response.json()
+        except ValueError:
+            _response_message = {}
+        errors = _response_message.get("errors") if isinstance(_response_message, dict) else None
+        if not errors:
+            return [f"unknown failure (status code {response.status_code})"]
+        return [f"{_error.get('errorType')}: {_error.get('message')}" for _error in errors]
+
+    def __fetch_export(self, exporter: ResourceExporter, resource: dict, limiter: AdaptiveConcurrency = None):
+        if not exporter.remote_fetch:
+            return exporter.fetch(resource)
+        self.rate_limiter.acquire()
+        if limiter:
+            with limiter.track():
+                return exporter.fetch(resource)
+        return exporter.fetch(resource)
+
+    def __export_destination(
+            self, export_folder, resource_type, pretty=False, incremental=False, store: ContentStore = None, run_name=None,
+            archive: ExportArchive = None):
+        server_name = self.__lhub.api.url.server_name
+        if archive:
+            # Folder inside the archive, named the same way as a regular export folder
+            manifest = ExportManifest(
+                folder=f"{server_name}_{resource_type}_{time.strftime('%Y-%m-%d')}_m{self.__lhub.api.version}", resource_type=resource_type,
+                server=server_name, server_version=self.__lhub.api.version, options={"pretty": pretty is True})
+            return ArchiveDestination(archive, manifest, pretty=pretty)
+        if store:
+            manifest = store.new_tree(run_name, server_name, resource_type, server_version=self.__lhub.api.version, options={"pretty": False})
+            previous = store.find_latest_tree(server_name, resource_type, exclude_run=run_name) if incremental else None
         else:
-            # Should never happen, but just in case...
-            raise lhub.exceptions.LhBaseException(f"\nERROR: Unknown file type. You will need to download manually: {resource_name} ({resource_id})")
-
-        with open(os.path.join(export_folder, file_name), write_mode) as _file:
-            _file.write(file_data)
-        self.__log.info(f"{file_info} - Saved successfully")
-
-    def export_playbooks(self, export_folder, limit=None, return_summary=False):
-        export_folder = self.__set_export_path(parent_folder=export_folder, export_type="flows")
-        self.__log.info(f"Saving files to: {export_folder}")
-        flow_ids = self.__lhub.actions.playbook_ids
-        flow_ids_list = sorted(list(flow_ids.keys()))
-        if limit:
-            flow_ids_list = flow_ids_list[:limit]
-        failed = {}
-        for n in range(len(flow_ids_list)):
-            _flow_id = flow_ids_list[n]
-            _flow_name = flow_ids[_flow_id]
-            _file_info = f"{n + 1} of {len(flow_ids_list)}: {_flow_id} ({_flow_name})"
-            self.__log.info(f"{_file_info} - Downloading...")
-            try:
-                _response = self.__lhub.api.export_playbook(_flow_id)
-                self.__save_export_to_disk(response=_response, export_folder=export_folder, resource_id=_flow_id, resource_name=_flow_name, file_info=_file_info)
-            except HTTPError:
+            folder = self.__set_export_path(parent_folder=export_folder, export_type=resource_type)
+            manifest = ExportManifest(
+                folder=folder, resource_type=resource_type, server=server_name,
+                server_version=self.__lhub.api.version, options={"pretty": pretty is True})
+            previous = ExportManifest.find_latest(export_folder, f"{server_name}_{resource_type}_", exclude=folder) if incremental else None
+        if previous and previous.options != manifest.options:
+            self.__log.warning(f"Previous export used different options; exporting everything", resource_type=resource_type, previous_export=previous.path)
+            previous = None
+        if incremental:
+            self.__log.info(f"Comparing with previous export: {previous.path}" if previous else "No previous export found; exporting everything", resource_type=resource_type)
+        if store:
+            return StoreDestination(store, manifest, previous)
+        return FolderDestination(manifest, previous, pretty=pretty)
+
+    def export_resources(
+            self, export_folder, resource_types: Iterable[str] = None, limit=None, max_workers: int = None, pretty=False,
+            incremental=False, content_store=False, run_name=None, archive: str = None) -> dict:
+        """
+        Export resources of one or more types as a single parallel job, into a new dated folder per resource type, each
+        with a _manifest.json describing what was exported (or into a single archive; see below)
+
+        :param export_folder: parent folder for the export (or the root of the store, with content_store)
+        :param resource_types: resource types to export (default: every type in features.exporters.EXPORTERS)
+        :param limit: optional: only export this many resources of each type
+        :param max_workers: maximum number of resources to download at once (default: max_workers from preferences). The
+            number in flight adapts to server latency, and calls share the instance's rate limit.
+        :param pretty: reformat JSON exports with indentation (slower, and needs the whole export in memory)
+        :param incremental: compare with the latest previous export of each type in export_folder; resources for which the
+            server reports an unchanged last-modified time are hardlinked from there without being downloaded, and the
+            rest are downloaded and compared by content hash
+        :param content_store: save into a content-addressed store (see features.exports.ContentStore) instead of new
+            folders, so that content shared between instances and runs is only stored once. Exports are kept exactly as
+            served, so pretty is ignored.
+        :param run_name: optional: with content_store, the run to record this export under (default: today's date), so
+            that nightly exports from many instances are grouped together
+        :param archive: optional: "gz" or "xz" to stream every export into one compressed tar file in export_folder
+            instead of writing individual files, with a manifest.json entry describing the contents (not compatible with
+            content_store or incremental)
+        :return: failures by resource type, then by resource ID: {"name": ..., "errors": [...]}
+        """
+        resource_types = list(resource_types or EXPORTERS.keys())
+        unknown = [t for t in resource_types if t not in EXPORTERS]
+        if unknown:
+            raise ValueError(f"Unknown resource type(s): {', '.join(unknown)}. Available types: {', '.join(EXPORTERS)}")
+        if archive and content_store:
+            raise ValueError("archive and content_store can not be used together")
+        if archive and archive not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive compression: {archive}. Available: {', '.join(ARCHIVE_FORMATS)}")
+        store = None
+        export_archive = None
+        if archive:
+            if incremental:
+                self.__log.warning("Incremental exports need a previous export on disk to link to; ignoring incremental for archive output")
+                incremental = False
+            export_type = resource_types[0] if len(resource_types) == 1 else "export"
+            export_archive = ExportArchive(self.__set_archive_path(export_folder, export_type, archive), compression=archive)
+            self.__log.info(f"Saving to archive: {export_archive.path}")
+        elif content_store:
+            store = ContentStore(export_folder)
+            run_name = run_name or time.strftime("%Y-%m-%d")
+            if pretty:
+                self.__log.warning("Exports are stored exactly as served in a content store; ignoring pretty")
+                pretty = False
+            self.__log.info(f"Saving to content store: {export_folder}", run=run_name)
+
+        try:
+            exporters, destinations, resources, failed = {}, {}, {}, {}
+            items = []
+            for resource_type in resource_types:
+                exporter = exporters[resource_type] = EXPORTERS[resource_type](self.__lhub)
+                failed[resource_type] = {}
+                try:
+                    _resources = {exporter.resource_id(r): r for r in exporter.list_resources()}
+                except CAPTURED_EXCEPTIONS as e:
+                    if isinstance(e, (CircuitOpen, lhub.exceptions.auth.AuthFailure)):
+                        raise
+                    # Keep going with the other types; this one is reported as a single failure
+                    self.__log.error(f"Unable to list {exporter.label}s: {self._export_error_messages(e)[0]}")
+                    failed[resource_type]["*"] = {"name": f"(all {exporter.label}s)", "errors": self._export_error_messages(e)}
+                    continue
+                resources[resource_type] = _resources
+                destinations[resource_type] = self.__export_destination(export_folder, resource_type, pretty, incremental, store, run_name, export_archive)
+                if not store:
+                    self.__log.info(f"Saving {exporter.label}s to: {destinations[resource_type].description}")
+                if exporter.metadata_only:
+                    self.__log.info(f"Only {exporter.label} list entries are available to export; these cannot be used to restore {exporter.label}s")
+                ids = sorted(_resources.keys(), key=str)
+                items.extend((resource_type, _id) for _id in (ids[:limit] if limit else ids))
+
+            # Resources sharing a name would overwrite each other's files, so add the ID to the file name for those
+            file_names = {}
+            for resource_type, _resources in resources.items():
+                names = {_id: re.sub(r'[^\w\-()\[\] +]', '_', exporters[resource_type].resource_name(r)) for _id, r in _resources.items()}
+                duplicates = {n for n, count in Counter(names.values()).items() if count > 1}
+                file_names[resource_type] = {_id: f"{n} ({_id})" if n in duplicates else n for _id, n in names.items()}
+
+            limiter = AdaptiveConcurrency(maximum=max_workers or self.performance.max_workers, logger=self.__log, name="export_resources")
+
+            def export(n):
+                _type, _id = items[n]
+                _exporter, _destination = exporters[_type], destinations[_type]
+                _resource = resources[_type][_id]
+                _name = _exporter.resource_name(_resource)
+                _last_modified = find_last_modified(_resource)
+                _previous = _destination.previous.entries.get(str(_id)) if _destination.previous else None
+                _previous_exists = _previous is not None and os.path.exists(_destination.previous_content_path(_previous))
+                if _previous_exists and _last_modified is not None and _previous["last_modified"] == _last_modified and _previous["name"] == _name:
+                    # Unchanged according to the server, so skip the download entirely
+                    _destination.carry_forward(_previous)
+                    return {**_previous, "carried_forward": True}
+
+                self.__log.debug(f"Downloading {_exporter.label}", resource_id=_id)
+                # Exports are read-only, so they are always safe to retry
+                _payload = self.retry_policy.call(self.__fetch_export, _exporter, _resource, limiter) if _exporter.remote_fetch else _exporter.fetch(_resource)
+                _export = _exporter.serialize(_resource, _payload)
+                _file_name = f"{file_names[_type][_id]}.{_export.file_type}"
+                _size, _sha256 = _destination.write(_file_name, _export)
+                _entry = {"name": _name, "file": _file_name, "sha256": _sha256, "size": _size, "last_modified": _last_modified, "exported_at": None}
+                if _previous_exists and _previous["sha256"] == _sha256 and _previous["file"] == _file_name:
+                    # Same content as last time. It has already been written, so only the original export time is kept.
+                    _entry["exported_at"] = _previous["exported_at"]
+                return _entry
+
+            def report(n, entry: dict = None, error: BaseException = None):
+                _type, _id = items[n]
+                _name = exporters[_type].resource_name(resources[_type][_id])
+                _file_info = f"{n + 1} of {len(items)}: {exporters[_type].label} {_id} ({_name})"
+                if error is None:
+                    destinations[_type].manifest.add(_id, name=_name, file_name=entry["file"], sha256=entry["sha256"], size=entry["size"], last_modified=entry["last_modified"], exported_at=entry["exported_at"])
+                    self.__log.info(f"{_file_info} - {'Unchanged; carried forward' if entry.get('carried_forward') else 'Saved successfully'}")
+                    return
                 warning = f"{_file_info} - Download FAILED"
-                _response_message = json.loads(self.__lhub.api.last_response_text)
-                if not failed.get(_flow_id):
-                    failed[_flow_id] = {"name": _flow_name, "errors": []}
-                if not _response_message.get("errors"):
-                    error = f"unknown failure (status code {self.__lhub.api.last_response_status})"
-                    new_warning = f"{warning}: {error}"
-                    failed[_flow_id]["errors"].append(error)
-                    self.__log.error(new_warning)
-                    with open(os.path.join(export_folder, "_FAILURES.log"), "a+") as _error_file:
-                        _error_file.write(new_warning + "\n")
-                else:
-                    for _error in _response_message.get("errors", []):
-                        error = f"{_error.get('errorType')}: {_error['message']}"
+                failed[_type][_id] = {"name": _name, "errors": self._export_error_messages(error)}
+                with open(destinations[_type].failures_log, "a+") as _error_file:
+                    for error in failed[_type][_id]["errors"]:
                         new_warning = f"{warning}: {error}"
-                        failed[_flow_id]["errors"].append(error)
                         self.__log.error(new_warning)
-                        with open(os.path.join(export_folder, "_FAILURES.log"), "a+") as _error_file:
-                            _error_file.write(new_warning + "\n")
+                        _error_file.write(new_warning + "\n")
+
+            # Downloads finish in any order; hold results until every earlier resource has been reported, so that logs,
+            # failure logs and the summary always come out in resource type and ID order
+            finished = {}
+            next_to_report = 0
+            start = time.perf_counter()
+            for task in iter_completed(export, range(len(items)), limiter=limiter):
+                if isinstance(task.error, (CircuitOpen, lhub.exceptions.auth.AuthFailure)):
+                    # The instance is down or the session is no longer valid, so every remaining export would fail too
+                    raise task.error
+                finished[task.item] = task
+                while next_to_report in finished:
+                    _task = finished.pop(next_to_report)
+                    report(next_to_report, entry=_task.result, error=_task.error)
+                    next_to_report += 1
 
-        self.__log.info("Playbook export complete")
+            for resource_type, destination in destinations.items():
+                previous = destination.previous
+                changes = destination.manifest.compare(previous, current_ids=resources[resource_type].keys())
+                destination.close()
+                if not previous:
+                    continue
+                label = exporters[resource_type].label
+                names = {**{_id: _entry["name"] for _id, _entry in previous.entries.items()}, **{str(_id): exporters[resource_type].resource_name(r) for _id, r in resources[resource_type].items()}}
+                for change_type in ("new", "changed", "removed"):
+                    for _id in changes[change_type]:
+                        self.__log.info(f"{label.capitalize()} {change_type}: {_id} ({names.get(_id)})")
+                self.__log.info(
+                    f"{label.capitalize()} changes since {previous.exported_at}: {len(changes['new'])} new, {len(changes['changed'])} changed, "
+                    f"{len(changes['unchanged'])} unchanged, {len(changes['removed'])} removed")
+        except BaseException:
+            if export_archive:
+                export_archive.abort()
+            raise
+        if export_archive:
+            export_archive.close(failures=failed)
+        failure_count = sum(len(v) for v in failed.values())
+        saved_count = len(items) - sum(len([_id for _id in v if _id != "*"]) for v in failed.values())
+        self.__log.info(
+            f"Export complete: {saved_count} saved, {failure_count} failed in {time.perf_counter() - start:.1f} seconds",
+            **limiter.summary())
+        return failed
+
+    def export_playbooks(
+            self, export_folder, limit=None, return_summary=False, max_workers: int = None, pretty=False, incremental=False,
+            content_store=False, run_name=None, archive: str = None):
+        """
+        Export every playbook to a new dated folder, along with a _manifest.json describing what was exported
+
+        Same as export_resources(resource_types=["flows"]); see there for parameters.
+
+        :param return_summary: return a tuple of (successful, failures by flow ID)
+        """
+        failed = self.export_resources(
+            export_folder, resource_types=[PlaybookExporter.resource_type], limit=limit, max_workers=max_workers,
+            pretty=pretty, incremental=incremental, content_store=content_store, run_name=run_name, archive=archive
+        )[PlaybookExporter.resource_type]
         if return_summary:
             successful = True
             if failed:
@@ -119,15 +309,120 @@ class Actions:
         for b in batch_ids if isinstance(batch_ids, list) else [batch_ids]:
             if b not in unique_ids:
                 unique_ids.append(b)
-        if sec_between_calls:
-            sec_between_calls = float(sec_between_calls)
-        for n in range(len(unique_ids)):
-            batch_id = unique_ids[n]
-            if sec_between_calls and n > 0:
-                time.sleep(sec_between_calls)
+        # Reprocessing is expensive server-side, so it gets its own (stricter) limit on top of the general one
+        reprocess_limiter = get_rate_limiter(
+            (self.__config.credentials.hostname, "reprocess_batches"),
+            rate=1 / float(self.performance.seconds_between_calls) if self.performance.seconds_between_calls else 0,
+            burst=1
+        )
+        # Pacing requested for this job only, which must not change the shared limit for every other job
+        job_limiter = TokenBucket(rate=1 / float(sec_between_calls) if sec_between_calls else 0, burst=1)
+        for batch_id in unique_ids:
+            job_limiter.acquire()
+            reprocess_limiter.acquire()
+            self.rate_limiter.acquire()
             _ = self.__lhub.actions.reprocess_batch(batch_id)
             self.__log.info(f'Batch {batch_id} rerun on {self.__instance_name}')
 
+    def __update_case(self, case_id, changes: dict, retry_policy: RetryPolicy, dry_run=False, limiter: AdaptiveConcurrency = None):
+        def update():
+            self.rate_limiter.acquire()
+            if limiter:
+                with limiter.track():
+                    return self.__lhub.api.case_update(case_id, **changes)
+            return self.__lhub.api.case_update(case_id, **changes)
+
+        if dry_run:
+            return 1
+        # Setting the same fields again is harmless, so the update is safe to repeat
+        return retry_policy.run(update, idempotent=True)[1]
+
+    def bulk_update_cases(
+            self, case_ids: Iterable, changes: dict, max_workers: int = None, retry_attempts: int = None,
+            dry_run=False, result_log: str = None, progress_seconds: float = 10, adaptive=True) -> dict:
+        """
+        Apply the same changes to many cases at once, e.g. bulk_update_cases(ids, {"status": "Resolved", "assignee": "jdoe"})
+
+        :param case_ids: case IDs to update. Can be any iterable (including a generator); duplicates are skipped.
+        :param changes: fields to set on every case, such as status, assignee or priority
+        :param max_workers: maximum number of updates in flight at once (default: max_workers from preferences). Calls are
+            also subject to the instance's shared rate limit (rate_limit and rate_burst in preferences).
+        :param retry_attempts: attempts per case for timeouts, connection errors, 429 and 5xx responses (default: retry_attempts from preferences)
+        :param dry_run: log what would be updated without changing anything
+        :param result_log: optional CSV file to which one line per case is written as it finishes
+        :param progress_seconds: how often to log progress and throughput
+        :param adaptive: adjust the number of updates in flight (up to max_workers) based on latency and overload responses
+        :return: summary dict with counts of updated and failed cases, elapsed seconds, concurrency limits reached, and a dict of errors by case ID
+        :raises CircuitOpen: if the instance stops responding, after logging the summary of what was done before that
+        """
+        if not changes:
+            raise lhub.exceptions.validation.InputValidationError(input_var=changes, action_description="bulk case update", message="No changes provided for updating cases")
+        max_workers = max_workers or self.performance.max_workers
+        retry_policy = self.retry_policy
+        if retry_attempts:
+            retry_policy = RetryPolicy(max_attempts=retry_attempts, budget=retry_policy.budget, breaker=retry_policy.breaker, logger=self.__log)
+
+        def unique_ids():
+            seen = set()
+            for _case_id in case_ids:
+                _case_id = _case_id.strip() if isinstance(_case_id, str) else _case_id
+                if _case_id and _case_id not in seen:
+                    seen.add(_case_id)
+                    yield _case_id
+
+        limiter = AdaptiveConcurrency(maximum=max_workers, logger=self.__log, name="bulk_update_cases") if adaptive and not dry_run else None
+        summary = {"updated": 0, "failed": 0, "dry_run": dry_run is True, "changes": changes, "errors": {}}
+        self.__log.info(
+            f"{'DRY RUN: ' if dry_run else ''}Updating cases", changes=changes, max_workers=max_workers,
+            concurrency_limit=limiter.limit if limiter else max_workers, rate_limit=self.rate_limiter.rate or None)
+        _log_file = open(result_log, "w", newline="") if result_log else None
+        _log_writer = csv.DictWriter(_log_file, fieldnames=BULK_UPDATE_LOG_HEADERS) if _log_file else None
+        if _log_writer:
+            _log_writer.writeheader()
+        start = _last_progress = time.perf_counter()
+        aborted = None
+        try:
+            for task in iter_completed(lambda c: self.__update_case(c, changes, retry_policy, dry_run, limiter), unique_ids(), max_workers=max_workers, limiter=limiter):
+                if task.successful:
+                    summary["updated"] += 1
+                    _row = {"case_id": task.item, "status": "dry_run" if dry_run else "updated", "attempts": task.result}
+                    self.__log.debug("Case updated", case_id=task.item)
+                else:
+                    summary["failed"] += 1
+                    _error = getattr(task.error, "message", None) or str(task.error) or repr(task.error)
+                    summary["errors"][task.item] = _error
+                    _row = {"case_id": task.item, "status": "failed", "attempts": getattr(task.error, "attempts", None), "error": _error}
+                    self.__log.error(f"Case update failed: {_error}", case_id=task.item)
+                if _log_writer:
+                    _log_writer.writerow({**_row, "seconds": round(task.elapsed, 3)})
+                    _log_file.flush()
+                if isinstance(task.error, CircuitOpen):
+                    # The instance is down; stop here rather than failing every remaining case one at a time
+                    aborted = task.error
+                    break
+                if time.perf_counter() - _last_progress >= progress_seconds:
+                    _last_progress = time.perf_counter()
+                    _done = summary["updated"] + summary["failed"]
+                    self.__log.info(
+                        f"Progress: {_done} cases done ({summary['failed']} failed), {_done / (_last_progress - start):.1f} cases/sec",
+                        concurrency_limit=limiter.limit if limiter else max_workers)
+        finally:
+            if _log_file:
+                _log_file.close()
+
+        summary["seconds"] = round(time.perf_counter() - start, 3)
+        _done = summary["updated"] + summary["failed"]
+        summary["cases_per_second"] = round(_done / summary["seconds"], 2) if summary["seconds"] else None
+        if limiter:
+            summary.update(limiter.summary())
+        self.__log.info(
+            f"{'DRY RUN: ' if dry_run else ''}Case update complete: {summary['updated']} updated, {summary['failed']} failed "
+            f"in {summary['seconds']:.1f} seconds ({summary['cases_per_second']} cases/sec)",
+            **(limiter.summary() if limiter else {}))
+        if aborted:
+            raise aborted
+        return summary
+
     @staticmethod
     def _reformat_user(user: dict):
         groups = [g['name'] for g in user['groups'] if not g.get("isDeleted", False)]
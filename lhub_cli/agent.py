@@ -0,0 +1,173 @@
+"""
+ssh-agent style credential cache
+
+A long-running agent process holds decrypted connection credentials (and saved sessions) in memory so that
+short-lived scripts can skip the RSA decryption step. Scripts only use the agent when the environment variable named
+by AGENT_SOCKET_ENV_VAR points to its Unix socket, so nothing changes unless the agent has been started and exported
+deliberately.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+from .log import generate_logger, ExpectedLoggerTypes
+from .statics import AGENT_SOCKET_ENV_VAR, AGENT_SOCKET_FILE_NAME, AGENT_DEFAULT_IDLE_TIMEOUT, LHUB_CONFIG_PATH
+
+DEFAULT_SOCKET_PATH = os.path.join(LHUB_CONFIG_PATH, AGENT_SOCKET_FILE_NAME)
+_MAX_MESSAGE_SIZE = 1024 * 1024
+
+
+def _agent_key(credentials_path, instance_label, modified_time):
+    # Including the file's modified time means that any change to the credentials file invalidates cached entries
+    return f"{credentials_path}|{modified_time}|{instance_label}"
+
+
+def _session_agent_key(session_path, file_version):
+    # Same idea for saved sessions: rewriting the session file (e.g. after a new login) invalidates the cached copy
+    return f"session|{session_path}|{file_version}"
+
+
+class _AgentRequestHandler(socketserver.StreamRequestHandler):
+    server: "_AgentServer"
+
+    def handle(self):
+        line = self.rfile.readline(_MAX_MESSAGE_SIZE)
+        try:
+            request = json.loads(line)
+            response = self.server.agent.handle_request(request)
+        except (ValueError, KeyError, TypeError) as err:
+            response = {"ok": False, "error": repr(err)}
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    agent: "CredentialAgent" = None
+
+
+class CredentialAgent:
+    """Unix socket server which holds decrypted credentials in memory until it has been idle for idle_timeout seconds"""
+
+    def __init__(self, socket_path=None, idle_timeout=None, logger: ExpectedLoggerTypes = None, log_level=None):
+        self.__log = logger or generate_logger(name=__name__, level=log_level)
+        self.socket_path = socket_path or DEFAULT_SOCKET_PATH
+        self.idle_timeout = float(idle_timeout or AGENT_DEFAULT_IDLE_TIMEOUT)
+        self.__credentials = {}
+        self.__lock = threading.Lock()
+        self.__last_activity = time.time()
+        self.__stop_requested = False
+
+    @property
+    def idle_seconds(self):
+        return time.time() - self.__last_activity
+
+    def handle_request(self, request: dict):
+        self.__last_activity = time.time()
+        op = request["op"]
+        with self.__lock:
+            if op == "get":
+                return {"ok": True, "value": self.__credentials.get(request["key"])}
+            elif op == "put":
+                self.__credentials[request["key"]] = request["value"]
+                return {"ok": True}
+            elif op == "clear":
+                self.__credentials.clear()
+                return {"ok": True}
+            elif op == "status":
+                return {"ok": True, "pid": os.getpid(), "entries": len(self.__credentials), "idle_timeout": self.idle_timeout}
+            elif op == "stop":
+                self.__stop_requested = True
+                return {"ok": True}
+        return {"ok": False, "error": f"Unsupported operation: {op}"}
+
+    def serve(self):
+        if os.path.exists(self.socket_path):
+            if AgentClient(self.socket_path).ping():
+                raise RuntimeError(f"An agent is already listening on {self.socket_path}")
+            # Stale socket left behind by an agent that did not exit cleanly
+            os.remove(self.socket_path)
+
+        # Restrict the socket to the current user before anything can connect to it
+        _old_umask = os.umask(0o177)
+        try:
+            server = _AgentServer(self.socket_path, _AgentRequestHandler)
+        finally:
+            os.umask(_old_umask)
+        server.agent = self
+        server.timeout = 1
+        self.__log.info(f"Credential agent listening on {self.socket_path} (idle timeout: {int(self.idle_timeout)} seconds)")
+        try:
+            while not self.__stop_requested and self.idle_seconds < self.idle_timeout:
+                server.handle_request()
+        finally:
+            server.server_close()
+            with self.__lock:
+                self.__credentials.clear()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        self.__log.info("Credential agent stopped")
+
+
+class AgentClient:
+    timeout = 2
+
+    def __init__(self, socket_path, logger: ExpectedLoggerTypes = None):
+        self.socket_path = socket_path
+        self.__log = logger or generate_logger(name=__name__)
+
+    @classmethod
+    def from_environment(cls, logger: ExpectedLoggerTypes = None):
+        """Return a client if the agent has been enabled via the environment, otherwise None"""
+        socket_path = os.environ.get(AGENT_SOCKET_ENV_VAR)
+        if not socket_path:
+            return None
+        return cls(socket_path, logger=logger)
+
+    def _send(self, request: dict):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as _socket:
+            _socket.settimeout(self.timeout)
+            _socket.connect(self.socket_path)
+            _socket.sendall(json.dumps(request).encode() + b"\n")
+            with _socket.makefile("rb") as _reader:
+                response = json.loads(_reader.readline(_MAX_MESSAGE_SIZE))
+        if not response.get("ok"):
+            raise ValueError(response.get("error") or "Agent request failed")
+        return response
+
+    def _send_safe(self, request: dict):
+        # The agent is only ever an optimization, so any failure to reach it falls back to local decryption
+        try:
+            return self._send(request)
+        except (OSError, ValueError) as err:
+            self.__log.debug(f"Credential agent unavailable ({self.socket_path}): {err!r}")
+            return None
+
+    def ping(self):
+        return self._send_safe({"op": "status"}) is not None
+
+    def status(self):
+        return self._send({"op": "status"})
+
+    def stop(self):
+        return self._send({"op": "stop"})
+
+    def clear(self):
+        return self._send({"op": "clear"})
+
+    def get_credentials(self, credentials_path, instance_label, modified_time):
+        response = self._send_safe({"op": "get", "key": _agent_key(credentials_path, instance_label, modified_time)})
+        return response.get("value") if response else None
+
+    def put_credentials(self, credentials_path, instance_label, modified_time, credentials: dict):
+        _ = self._send_safe({"op": "put", "key": _agent_key(credentials_path, instance_label, modified_time), "value": credentials})
+
+    def get_session(self, session_path, file_version):
+        response = self._send_safe({"op": "get", "key": _session_agent_key(session_path, file_version)})
+        return response.get("value") if response else None
+
+    def put_session(self, session_path, file_version, details: dict):
+        _ = self._send_safe({"op": "put", "key": _session_agent_key(session_path, file_version), "value": details})
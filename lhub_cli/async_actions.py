@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterable
+
+import lhub
+
+from .actions import Actions
+from .common.concurrency import TaskResult, CAPTURED_EXCEPTIONS
+from .log import generate_logger, ExpectedLoggerTypes
+
+
+class _AsyncProxy:
+    """Wrap an object so that each of its methods returns an awaitable which runs the blocking call in the executor"""
+
+    def __init__(self, target, runner: Callable):
+        self.__target = target
+        self.__run = runner
+
+    def __getattr__(self, item):
+        attr = getattr(self.__target, item)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.__run(attr, *args, **kwargs)
+        return wrapper
+
+
+class AsyncActions:
+    """
+    Awaitable versions of Actions (and of the underlying lhub API calls) for use from asyncio code
+
+    lhub is fully blocking, so every call runs on a thread pool owned by this object, and a semaphore caps how many
+    calls are in flight against this instance at once. Every call also waits for the instance's shared rate limiter
+    (Actions.rate_limiter), on the worker thread rather than the event loop. Any Actions method can be awaited
+    directly, e.g.:
+
+        async with cli.async_actions as async_actions:
+            users = await async_actions.list_users(print_output=False)
+            await async_actions.api.case_update(case_id, status="Resolved")
+    """
+
+    def __init__(self, actions: Actions, session: lhub.LogicHub, max_concurrency: int = None, logger: ExpectedLoggerTypes = None):
+        """
+        :param actions: Actions object for the instance
+        :param session: LogicHub session for the instance
+        :param max_concurrency: maximum number of calls in flight at once (default: max_workers from preferences)
+        :param logger: optional logger
+        """
+        self.__log = logger or generate_logger(name=__name__)
+        self.__actions = actions
+        self.max_concurrency = max(1, int(max_concurrency or actions.performance.max_workers))
+        self.__executor = None
+        # asyncio primitives belong to a single event loop, so keep one semaphore per loop in case of repeated asyncio.run calls
+        self.__semaphores = {}
+
+        # Awaitable wrappers for the lhub API and lhub's own actions
+        self.api = _AsyncProxy(session.api, self.run)
+        self.lhub_actions = _AsyncProxy(session.actions, self.run)
+        self.__actions_proxy = _AsyncProxy(actions, self.run)
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return getattr(self.__actions_proxy, item)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="lhub_cli_async")
+        return self.__executor
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self.__semaphores:
+            self.__semaphores = {loop: asyncio.Semaphore(self.max_concurrency)}
+        return self.__semaphores[loop]
+
+    def __call_rate_limited(self, func: Callable, *args, **kwargs):
+        self.__actions.rate_limiter.acquire()
+        return func(*args, **kwargs)
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run any blocking callable on the executor, bounded by this instance's semaphore and shared rate limit"""
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(self.__call_rate_limited, func, *args, **kwargs))
+
+    async def __run_task(self, func: Callable, item) -> TaskResult:
+        start = time.perf_counter()
+        try:
+            return TaskResult(item=item, result=await self.run(func, item), elapsed=time.perf_counter() - start)
+        except CAPTURED_EXCEPTIONS as err:
+            return TaskResult(item=item, error=err, elapsed=time.perf_counter() - start)
+
+    async def gather_limited(self, func: Callable, items: Iterable, return_exceptions=False) -> list:
+        """
+        Run func(item) for every item with bounded concurrency, and return the results in the same order as items
+
+        :param func: blocking callable which accepts a single item
+        :param items: items to process
+        :param return_exceptions: return exceptions in place of results instead of raising the first one
+        """
+        results = await asyncio.gather(*[self.__run_task(func, item) for item in items])
+        if not return_exceptions:
+            for task in results:
+                if not task.successful:
+                    raise task.error
+        return [task.result if task.successful else task.error for task in results]
+
+    async def as_completed(self, func: Callable, items: Iterable) -> AsyncIterator[TaskResult]:
+        """
+        Run func(item) for every item with bounded concurrency, and yield a TaskResult for each one as soon as it finishes
+
+        Exceptions are captured on the TaskResult instead of being raised, so one failure never stops the rest.
+        """
+        tasks = [asyncio.ensure_future(self.__run_task(func, item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def close(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1 +1 @@
-from . import args, config, output, shell
+from . import args, concurrency, config, files, output, rate_limit, retry, shell
@@ -0,0 +1,183 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Sized
+
+from lhub.exceptions.base import LhBaseException
+from requests.exceptions import HTTPError, Timeout
+
+DEFAULT_MAX_WORKERS = 8
+
+# Responses which mean the server is overloaded or struggling, rather than that the request itself is bad
+OVERLOAD_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# lhub exceptions inherit from BaseException rather than Exception, so both have to be caught explicitly
+CAPTURED_EXCEPTIONS = (Exception, LhBaseException)
+
+
+@dataclass
+class TaskResult:
+    item: Any
+    result: Any = None
+    error: BaseException = None
+    elapsed: float = None
+
+    @property
+    def successful(self):
+        return self.error is None
+
+
+def is_overload_error(err: BaseException):
+    if isinstance(err, Timeout):
+        return True
+    response = getattr(err, "response", None)
+    return isinstance(err, HTTPError) and response is not None and response.status_code in OVERLOAD_STATUS_CODES
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD (additive increase, multiplicative decrease) concurrency limit, similar to TCP congestion control
+
+    Every call reports its latency and outcome through record() or track(). While latency stays near the baseline, the
+    limit grows by one for each "limit" successful calls in a row. On a 429/5xx/timeout, or a call that takes much longer
+    than the baseline, the limit is cut by decrease_factor (at most once per "limit" calls, so one burst of failures does
+    not collapse it to the minimum).
+    """
+
+    def __init__(
+            self, maximum: int, minimum: int = 1, initial: int = None, decrease_factor: float = 0.5,
+            latency_tolerance: float = 2.0, logger=None, name=None):
+        """
+        :param maximum: upper bound for the limit (normally max_workers)
+        :param minimum: lower bound for the limit
+        :param initial: starting limit (default: halfway between minimum and maximum)
+        :param decrease_factor: multiplier applied to the limit on overload
+        :param latency_tolerance: a call counts as a latency spike once it takes this many times the baseline latency
+        :param logger: optional logger; limit changes are logged at debug level
+        :param name: optional label for log messages
+        """
+        self.__lock = threading.Lock()
+        self.log = logger
+        self.name = name
+        self.minimum = max(1, int(minimum))
+        self.maximum = max(self.minimum, int(maximum))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.limit = max(self.minimum, min(self.maximum, int(initial or (self.minimum + self.maximum) // 2)))
+        self.peak_limit = self.lowest_limit = self.limit
+        self.baseline_latency = None
+        self.increases = self.decreases = 0
+        self.__successes = 0
+        self.__calls_since_decrease = self.limit
+
+    def __set_limit(self, new_limit, reason):
+        new_limit = max(self.minimum, min(self.maximum, new_limit))
+        if new_limit == self.limit:
+            return
+        if self.log:
+            self.log.debug(
+                f"Concurrency limit {'raised' if new_limit > self.limit else 'cut'} to {new_limit}",
+                name=self.name, previous_limit=self.limit, reason=reason, baseline_latency=round(self.baseline_latency or 0, 3))
+        self.limit = new_limit
+        self.peak_limit = max(self.peak_limit, new_limit)
+        self.lowest_limit = min(self.lowest_limit, new_limit)
+
+    def record(self, elapsed: float, error: BaseException = None):
+        """Report the latency (in seconds) and outcome of one call"""
+        with self.__lock:
+            self.__calls_since_decrease += 1
+            spike = False
+            if error is None:
+                if self.baseline_latency is None:
+                    self.baseline_latency = elapsed
+                spike = elapsed > self.baseline_latency * self.latency_tolerance
+                # Track gradual drift quickly, but let spikes move the baseline only slowly
+                self.baseline_latency += (elapsed - self.baseline_latency) * (0.02 if spike else 0.1)
+
+            if is_overload_error(error) or spike:
+                self.__successes = 0
+                if self.__calls_since_decrease >= self.limit:
+                    self.__calls_since_decrease = 0
+                    self.decreases += 1
+                    self.__set_limit(int(self.limit * self.decrease_factor), reason="latency spike" if spike else "overloaded")
+            elif error is None:
+                self.__successes += 1
+                if self.__successes >= self.limit:
+                    self.__successes = 0
+                    self.increases += 1
+                    self.__set_limit(self.limit + 1, reason="latency steady")
+
+    def track(self):
+        """Context manager which times the enclosed call and records the result"""
+        return _TrackedCall(self)
+
+    def summary(self) -> dict:
+        return {
+            "concurrency_limit": self.limit,
+            "concurrency_peak": self.peak_limit,
+            "concurrency_lowest": self.lowest_limit,
+            "baseline_latency": round(self.baseline_latency, 3) if self.baseline_latency is not None else None,
+        }
+
+
+class _TrackedCall:
+    def __init__(self, limiter: AdaptiveConcurrency):
+        self.limiter = limiter
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.limiter.record(time.perf_counter() - self.start, exc_val)
+
+
+def _run_task(func: Callable, item) -> TaskResult:
+    start = time.perf_counter()
+    try:
+        return TaskResult(item=item, result=func(item), elapsed=time.perf_counter() - start)
+    except CAPTURED_EXCEPTIONS as err:
+        return TaskResult(item=item, error=err, elapsed=time.perf_counter() - start)
+
+
+def iter_completed(
+        func: Callable, items: Iterable, max_workers: int = None, thread_name_prefix="lhub_cli",
+        limiter: AdaptiveConcurrency = None) -> Iterator[TaskResult]:
+    """
+    Run func(item) for every item on a bounded thread pool, and yield a TaskResult for each one as soon as it finishes
+
+    Exceptions raised by func are captured on the TaskResult instead of being raised, so one failure never stops the rest.
+    Items are pulled from the iterable only as workers free up, so it can be a generator of any length.
+
+    :param func: callable which accepts a single item
+    :param items: items to process
+    :param max_workers: maximum number of concurrent threads (default: DEFAULT_MAX_WORKERS)
+    :param thread_name_prefix: prefix for worker thread names, which shows up in debug logs
+    :param limiter: optional adaptive limit on the number of tasks running at once (max_workers defaults to its maximum).
+        func is responsible for reporting each call to it, e.g. with limiter.track().
+    """
+    max_workers = max(1, int(max_workers or (limiter.maximum if limiter else DEFAULT_MAX_WORKERS)))
+    if isinstance(items, Sized):
+        if not len(items):
+            return
+        max_workers = min(max_workers, len(items))
+    items = iter(items)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+    pending = set()
+    try:
+        while True:
+            # Keep one queued task per worker on top of the running ones, so that threads never sit idle between results.
+            # With an adaptive limiter, only allow as many tasks as its current limit.
+            window = min(limiter.limit, max_workers) if limiter else max_workers * 2
+            for item in itertools.islice(items, max(0, window - len(pending))):
+                pending.add(executor.submit(_run_task, func, item))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # If the caller stops early (or Ctrl-C is pressed), do not start anything that has not begun yet
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,4 +1,7 @@
+import csv
+import json
 import os
+import threading
 from pathlib import Path
 
 from configobj import ConfigObj
@@ -7,8 +10,10 @@ from ..statics import CREDENTIALS_FILE_NAME, LHUB_CONFIG_PATH
 
 
 def dict_to_ini_file(dict_obj, file_path, sort_keys=True):
+    # Write to a temporary file first and then swap it into place, so that the file is never left half-written
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
     config = ConfigObj(indent_type='    ', write_empty_values=True)
-    config.filename = file_path
+    config.filename = temp_path
     _first_line = True
     if sort_keys:
         # Sort by connection name in order to make the credential file more readable
@@ -22,7 +27,98 @@ def dict_to_ini_file(dict_obj, file_path, sort_keys=True):
             # Hack for adding a blank line between sections: Insert an empty comment before each section
             # https://sourceforge.net/p/configobj/mailman/message/24432354/
             config.comments[k].insert(0, '')
-    config.write()
+    try:
+        config.write()
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def read_records_file(file_path) -> list:
+    """
+    Read a list of records (dicts) from a CSV or JSON file
+
+    JSON files may contain either a list of objects or a single object whose keys are used as the "name" of each record.
+    """
+    if file_path.lower().endswith(".json"):
+        with open(file_path) as _file:
+            records = json.load(_file)
+        if isinstance(records, dict):
+            records = [{"name": k, **v} for k, v in records.items()]
+        return records
+    with open(file_path, newline='') as _file:
+        # Treat empty CSV cells as missing values
+        return [{k: v for k, v in row.items() if v not in (None, '')} for row in csv.DictReader(_file)]
+
+
+# Parsed INI files shared by everything in the process: {path: (mtime_ns, size, data)}
+_INI_SNAPSHOTS = {}
+_INI_SNAPSHOTS_LOCK = threading.Lock()
+_SNAPSHOT_VERSION = 1
+
+
+def _snapshot_path(file_path):
+    _folder, _file_name = os.path.split(file_path)
+    return os.path.join(_folder, f".{_file_name}.snapshot")
+
+
+def _copy_ini_data(data: dict):
+    # Callers are free to modify what they get back, so never hand out the shared copy itself
+    return {k: dict(v) if isinstance(v, dict) else v for k, v in data.items()}
+
+
+def _read_disk_snapshot(file_path, mtime_ns, size):
+    try:
+        with open(_snapshot_path(file_path)) as _file:
+            snapshot = json.load(_file)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("version") != _SNAPSHOT_VERSION or snapshot.get("mtime_ns") != mtime_ns or snapshot.get("size") != size:
+        return None
+    return snapshot.get("data")
+
+
+def _write_disk_snapshot(file_path, mtime_ns, size, data):
+    snapshot_path = _snapshot_path(file_path)
+    temp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        _fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(_fd, "w") as _file:
+            json.dump({"version": _SNAPSHOT_VERSION, "mtime_ns": mtime_ns, "size": size, "data": data}, _file, separators=(",", ":"))
+        os.replace(temp_path, snapshot_path)
+    except OSError:
+        # The snapshot is only a cache; failing to write it just means the next process parses the INI again
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_ini_file(file_path, refresh=False) -> dict:
+    """
+    Load an INI file as a dict, using a cached snapshot whenever the file's mtime and size have not changed.
+
+    Snapshots are kept in memory for the life of the process, and also stored as compact JSON next to the file
+    (".<file name>.snapshot") so that new processes can skip parsing the INI as well.
+
+    :param file_path: path to the INI file
+    :param refresh: ignore any existing snapshot and parse the file again
+    """
+    _stat = os.stat(file_path)
+    mtime_ns, size = _stat.st_mtime_ns, _stat.st_size
+    with _INI_SNAPSHOTS_LOCK:
+        _cached = _INI_SNAPSHOTS.get(file_path)
+    if not refresh and _cached and _cached[:2] == (mtime_ns, size):
+        return _copy_ini_data(_cached[2])
+
+    data = None if refresh else _read_disk_snapshot(file_path, mtime_ns, size)
+    if data is None:
+        data = ConfigObj(file_path).dict()
+        _write_disk_snapshot(file_path, mtime_ns, size, data)
+    with _INI_SNAPSHOTS_LOCK:
+        _INI_SNAPSHOTS[file_path] = (mtime_ns, size, data)
+    return _copy_ini_data(data)
 
 
 def list_credential_files():
@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+from typing import Iterator, Tuple
+
+# Base64 characters decoded at a time; always a multiple of 4 so that each chunk decodes on its own
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+_THREAD_LOCKS = {}
+_THREAD_LOCKS_LOCK = threading.Lock()
+
+
+@contextmanager
+def file_lock(lock_path):
+    """
+    Exclusive lock shared by every thread and process using the same lock_path (a separate file, created if needed)
+
+    Processes are only coordinated where fcntl is available; threads in the same process always are.
+    """
+    with _THREAD_LOCKS_LOCK:
+        thread_lock = _THREAD_LOCKS.setdefault(os.path.abspath(lock_path), threading.Lock())
+    with thread_lock:
+        if not fcntl:
+            yield
+            return
+        _fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(_fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(_fd)
+
+
+@contextmanager
+def atomic_write(file_path, mode="wb"):
+    """
+    Open a temporary file next to file_path for writing, and swap it into place only once it has been written in full
+
+    Readers never see a half-written file, and a failed write leaves any existing file untouched.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, mode) as _file:
+            yield _file
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def iter_base64_decode(content_b64: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Decode a base64 string a piece at a time, so that the full decoded content never has to be held in memory"""
+    chunk_size = max(4, chunk_size - chunk_size % 4)
+    carry = ""
+    for n in range(0, len(content_b64), chunk_size):
+        # Line breaks would shift later chunks off a 4-character boundary, so strip whitespace and carry any remainder
+        piece = carry + "".join(content_b64[n:n + chunk_size].split())
+        cut = len(piece) - len(piece) % 4
+        carry = piece[cut:]
+        if cut:
+            yield base64.b64decode(piece[:cut])
+    if carry:
+        yield base64.b64decode(carry)
+
+
+class Base64Reader:
+    """Read-only file object over base64 content, decoding a chunk at a time (for streaming into tarfile and the like)"""
+
+    def __init__(self, content_b64: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.__chunks = iter_base64_decode(content_b64, chunk_size)
+        self.__buffer = b""
+
+    def read(self, size=-1) -> bytes:
+        while size is None or size < 0 or len(self.__buffer) < size:
+            try:
+                self.__buffer += next(self.__chunks)
+            except StopIteration:
+                break
+        if size is None or size < 0:
+            size = len(self.__buffer)
+        data, self.__buffer = self.__buffer[:size], self.__buffer[size:]
+        return data
+
+
+def write_base64_to_file(content_b64: str, file_path, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[int, str]:
+    """
+    Decode base64 content straight to disk, atomically
+
+    :return: tuple of (number of bytes written, sha256 hex digest of the decoded content)
+    """
+    written = 0
+    digest = hashlib.sha256()
+    with atomic_write(file_path, "wb") as _file:
+        for chunk in iter_base64_decode(content_b64, chunk_size):
+            digest.update(chunk)
+            written += _file.write(chunk)
+    return written, digest.hexdigest()
+
+
+def write_bytes_to_file(data: bytes, file_path) -> Tuple[int, str]:
+    """
+    Write bytes to disk atomically
+
+    :return: tuple of (number of bytes written, sha256 hex digest of the content)
+    """
+    with atomic_write(file_path, "wb") as _file:
+        _file.write(data)
+    return len(data), hashlib.sha256(data).hexdigest()
+
+
+def link_or_copy(source_path, file_path):
+    """
+    Hardlink source_path to file_path (replacing any existing file), falling back to a copy where hardlinks are not
+    supported, such as across filesystems
+
+    :return: True if a hardlink was created, False if the file was copied
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            os.link(source_path, temp_path)
+            linked = True
+        except OSError:
+            shutil.copy2(source_path, temp_path)
+            linked = False
+        os.replace(temp_path, file_path)
+        return linked
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def pretty_print_json_file(file_path, indent=4):
+    """Reformat a JSON file in place with indentation (reads the whole file into memory)"""
+    with open(file_path, "rb") as _file:
+        data = json.load(_file)
+    with atomic_write(file_path, "w") as _file:
+        json.dump(data, _file, indent=indent)
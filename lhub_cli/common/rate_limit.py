@@ -0,0 +1,79 @@
+import threading
+import time
+
+# Shared limiters, keyed by whatever the caller uses to identify an instance (normally its hostname)
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows bursts of up to "burst" calls, then a steady "rate" calls per second
+
+    A rate of 0 (or less) disables limiting entirely.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.__lock = threading.Lock()
+        self.rate = self.burst = None
+        self.__tokens = self.__updated = None
+        self.update(rate, burst)
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def update(self, rate: float, burst: float = None):
+        """Change the rate and burst size, keeping any tokens already saved up (up to the new burst size)"""
+        with self.__lock:
+            self.rate = float(rate or 0)
+            self.burst = max(1.0, float(burst or self.rate or 1))
+            now = time.monotonic()
+            if self.__tokens is None:
+                self.__tokens = self.burst
+            self.__tokens = min(self.__tokens, self.burst)
+            self.__updated = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, waiting until enough are available
+
+        Waits are reserved in the order callers arrive, so concurrent callers are spaced out evenly rather than all
+        waking up at once.
+
+        :return: number of seconds spent waiting
+        """
+        if not self.enabled:
+            return 0
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= tokens
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+def get_rate_limiter(key, rate: float, burst: float = None) -> TokenBucket:
+    """
+    Return the process-wide limiter for a key, creating it if needed, so every job against the same instance shares it
+
+    If the limiter already exists with different settings, the most restrictive of the two wins: the lower rate (where
+    0 means unlimited) and the smaller burst. No caller can loosen a limit which another job depends on.
+    """
+    rate = float(rate or 0)
+    with _LIMITERS_LOCK:
+        if key not in _LIMITERS:
+            _LIMITERS[key] = TokenBucket(rate, burst)
+            return _LIMITERS[key]
+        limiter = _LIMITERS[key]
+    if rate <= 0:
+        return limiter
+    burst = max(1.0, float(burst or rate))
+    if limiter.enabled:
+        rate, burst = min(rate, limiter.rate), min(burst, limiter.burst)
+    if (limiter.rate, limiter.burst) != (rate, burst):
+        limiter.update(rate, burst)
+    return limiter
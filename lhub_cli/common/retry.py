@@ -0,0 +1,241 @@
+import random
+import threading
+import time
+from typing import Callable, Tuple
+
+from requests.exceptions import ConnectionError, ConnectTimeout, HTTPError, Timeout
+
+from .concurrency import CAPTURED_EXCEPTIONS
+from ..exceptions.app import CircuitOpen
+
+# Responses which mean the request was not processed at all, so even non-idempotent calls are safe to send again
+NOT_PROCESSED_STATUS_CODES = (429, 503)
+# Responses which are worth retrying for idempotent calls
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Shared budgets and circuit breakers, keyed by instance (normally its hostname)
+_BUDGETS = {}
+_BREAKERS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _status_code(err: BaseException):
+    response = getattr(err, "response", None)
+    return response.status_code if isinstance(err, HTTPError) and response is not None else None
+
+
+def is_retryable(err: BaseException, idempotent=True):
+    """
+    Whether a failed call can be sent again
+
+    Idempotent calls are retried on any connection error, timeout, 429 or 5xx. Other calls are only retried when the
+    request can not have been processed: the connection was never established, or the server answered 429/503.
+    """
+    if isinstance(err, CircuitOpen):
+        return False
+    if isinstance(err, ConnectTimeout):
+        return True
+    if idempotent and isinstance(err, (ConnectionError, Timeout)):
+        return True
+    return _status_code(err) in (RETRYABLE_STATUS_CODES if idempotent else NOT_PROCESSED_STATUS_CODES)
+
+
+def is_instance_failure(err: BaseException):
+    """Failures which suggest the instance itself is down or unhealthy (as opposed to a bad request)"""
+    return isinstance(err, (ConnectionError, Timeout)) or (_status_code(err) or 0) >= 500
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of all calls, so that retries can never multiply the load on a struggling server
+
+    Every call deposits "ratio" tokens, and every retry withdraws one. min_retries are always available to start with.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        self.__lock = threading.Lock()
+        self.ratio = float(ratio)
+        self.max_tokens = max(float(min_retries), 100 * self.ratio)
+        self.__tokens = float(min_retries)
+
+    def deposit(self):
+        with self.__lock:
+            self.__tokens = min(self.max_tokens, self.__tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.__lock:
+            if self.__tokens < 1:
+                return False
+            self.__tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Stop calling an instance after repeated failures, then let a single trial call through once reset_seconds pass
+
+    States: "closed" (normal), "open" (calls fail immediately with CircuitOpen) and "half_open" (one trial call in
+    flight; success closes the circuit, failure opens it again). Other calls made while half-open wait for the trial
+    call's result, so they only fail with CircuitOpen if the instance is still down.
+    """
+
+    def __init__(self, name, failure_threshold: int = 5, reset_seconds: float = 30, logger=None):
+        self.__lock = threading.Lock()
+        self.__state_changed = threading.Condition(self.__lock)
+        self.name = name
+        self.failure_threshold = int(failure_threshold)
+        self.reset_seconds = float(reset_seconds)
+        self.log = logger
+        self.state = "closed"
+        self.failures = 0
+        self.__opened_at = None
+
+    @property
+    def enabled(self):
+        return self.failure_threshold > 0
+
+    def before_call(self):
+        """Raise CircuitOpen if calls to this instance should be skipped right now"""
+        if not self.enabled:
+            return
+        with self.__lock:
+            if self.state == "half_open":
+                # Wait for the trial call to finish; if it never reports back (e.g. it was interrupted), take over as the trial
+                if not self.__state_changed.wait_for(lambda: self.state != "half_open", timeout=self.reset_seconds):
+                    return
+            if self.state == "closed":
+                return
+            remaining = self.__opened_at + self.reset_seconds - time.monotonic()
+            if remaining <= 0:
+                self.state = "half_open"
+                if self.log:
+                    self.log.info(f"Circuit half-open; sending a trial call", instance=self.name)
+                return
+        raise CircuitOpen(instance=self.name, retry_after=max(0, remaining))
+
+    def record_success(self):
+        with self.__lock:
+            if self.state != "closed" and self.log:
+                self.log.info(f"Circuit closed; instance is responding again", instance=self.name)
+            self.state = "closed"
+            self.failures = 0
+            self.__state_changed.notify_all()
+
+    def record_failure(self, err: BaseException = None):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.__opened_at = time.monotonic()
+                if self.log:
+                    self.log.warning(
+                        f"Circuit opened after {self.failures} consecutive failures; skipping calls for {self.reset_seconds:.0f} seconds",
+                        instance=self.name, error=repr(err))
+            self.__state_changed.notify_all()
+
+
+class RetryPolicy:
+    """
+    Retry calls with exponential backoff and full jitter, within a shared retry budget and behind a circuit breaker
+
+    Example:
+        policy = RetryPolicy(max_attempts=3, breaker=get_circuit_breaker("myhost"))
+        result = policy.call(session.api.export_playbook, flow_id)
+        result = policy.call(session.api.case_update, case_id, idempotent=False, status="Resolved")
+    """
+
+    def __init__(
+            self, max_attempts: int = 3, base_delay: float = 1, max_delay: float = 30,
+            budget: RetryBudget = None, breaker: CircuitBreaker = None, logger=None):
+        """
+        :param max_attempts: total attempts per call, including the first (1 disables retries)
+        :param base_delay: ceiling, in seconds, for the delay before the first retry; it doubles for each retry after that
+        :param max_delay: largest delay, in seconds, between attempts
+        :param budget: optional shared retry budget
+        :param breaker: optional circuit breaker for the instance being called
+        :param logger: optional logger
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker
+        self.log = logger
+
+    def delay(self, attempt: int, err: BaseException = None) -> float:
+        """Seconds to wait before the next attempt, honouring a Retry-After header from the server if there is one"""
+        response = getattr(err, "response", None)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.strip().isdigit():
+            return min(self.max_delay, float(retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def run(self, func: Callable, *args, idempotent=True, **kwargs) -> Tuple[object, int]:
+        """
+        Call func until it succeeds, it fails with an error which is not retryable, or attempts run out
+
+        :param func: callable to run
+        :param idempotent: whether repeating the call is harmless even if the server already processed it
+        :return: tuple of (result, number of attempts). On failure, the final exception is raised with an "attempts" attribute.
+        """
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                if self.breaker:
+                    self.breaker.before_call()
+                result = func(*args, **kwargs)
+            except CAPTURED_EXCEPTIONS as err:
+                if self.breaker and not isinstance(err, CircuitOpen):
+                    # Any other error (such as a 404) still proves that the instance is up
+                    if is_instance_failure(err):
+                        self.breaker.record_failure(err)
+                    else:
+                        self.breaker.record_success()
+                if attempts >= self.max_attempts or not is_retryable(err, idempotent) or (self.budget and not self.budget.withdraw()):
+                    err.attempts = attempts
+                    raise
+                delay = self.delay(attempts, err)
+                if self.log:
+                    self.log.debug(f"Call failed; retrying in {delay:.1f} seconds", attempt=attempts, error=repr(err))
+                time.sleep(delay)
+            else:
+                if self.breaker:
+                    self.breaker.record_success()
+                if self.budget:
+                    self.budget.deposit()
+                return result, attempts
+
+    def call(self, func: Callable, *args, idempotent=True, **kwargs):
+        """Same as run(), but returns only the result"""
+        return self.run(func, *args, idempotent=idempotent, **kwargs)[0]
+
+
+def get_retry_budget(key, ratio: float = 0.2) -> RetryBudget:
+    with _REGISTRY_LOCK:
+        if key not in _BUDGETS:
+            _BUDGETS[key] = RetryBudget(ratio=ratio)
+        return _BUDGETS[key]
+
+
+def get_circuit_breaker(key, failure_threshold: int = 5, reset_seconds: float = 30, logger=None) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for an instance, creating it if needed"""
+    with _REGISTRY_LOCK:
+        if key not in _BREAKERS:
+            _BREAKERS[key] = CircuitBreaker(key, failure_threshold=failure_threshold, reset_seconds=reset_seconds, logger=logger)
+        return _BREAKERS[key]
+
+
+def get_retry_policy(key, performance, logger=None) -> RetryPolicy:
+    """
+    Build a RetryPolicy for an instance from its [performance] preferences, sharing the instance's retry budget and
+    circuit breaker with every other policy for the same key in this process
+    """
+    return RetryPolicy(
+        max_attempts=performance.retry_attempts,
+        budget=get_retry_budget(key, ratio=performance.retry_budget),
+        breaker=get_circuit_breaker(key, performance.circuit_breaker_failures, performance.circuit_breaker_seconds, logger=logger),
+        logger=logger,
+    )
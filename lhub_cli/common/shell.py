@@ -61,6 +61,7 @@ def query_yes_no(question, default: (str, bool) = None):
 
 
 def main_script_wrapper(func, *args, **kwargs):
+    from ..exceptions.app import CircuitOpen
     from ..exceptions.base import LhCliBaseException
     from lhub.exceptions.base import LhBaseException
     from requests.exceptions import RequestException
@@ -83,6 +84,11 @@ def main_script_wrapper(func, *args, **kwargs):
     except SystemExit:
         pass
 
+    except CircuitOpen as e:
+        # Expected when an instance goes down mid-run; the retries have already been spent, so just report it
+        exit_code = 1
+        logger.critical(f"Stopped: {e.message}")
+
     except (LhBaseException, LhCliBaseException, RequestException) as e:
         exit_code = 1
         message = getattr(e, "message", None)
@@ -1,18 +1,24 @@
 from pathlib import Path
+import atexit
 import os
+import shutil
 from configobj import ConfigObj
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace
 from dataclasses_json import dataclass_json
 from lhub import LogicHub
-from .encryption import Encryption
+from .agent import AgentClient
+from .encryption import Encryption, EnvelopeEncryption
 import getpass
-from .common.config import dict_to_ini_file
+from .common.config import dict_to_ini_file, load_ini_file
+from .common.files import file_lock
 from .statics import CREDENTIALS_FILE_NAME, LHUB_CONFIG_PATH, PREFERENCES_FILE_NAME
+from .common.concurrency import iter_completed
 from .common.shell import query_yes_no
 from requests.exceptions import SSLError
 from .exceptions.base import CLIValueError
 from .exceptions.app import ConnectionNotFound
 import sys
+import threading
 from .log import generate_logger, ExpectedLoggerTypes
 
 
@@ -20,6 +26,12 @@ from .log import generate_logger, ExpectedLoggerTypes
 @dataclass
 class _PreferenceMain:
     default_instance: str = None
+    # Re-encrypt secrets still stored in the legacy (RSA only) format whenever a credentials file is loaded
+    migrate_legacy_secrets: bool = True
+
+    def __post_init__(self):
+        if isinstance(self.migrate_legacy_secrets, str):
+            self.migrate_legacy_secrets = self.migrate_legacy_secrets.strip().lower() not in ("false", "no", "off", "0")
 
 
 @dataclass_json
@@ -28,24 +40,97 @@ class _PreferenceCommands:
     table_style: str = None
 
 
+@dataclass_json
+@dataclass
+class _PreferencePerformance:
+    """
+    Tuning for HTTP calls and bulk operations.
+
+    Values in the [performance] section apply to every instance. Any of them can be overridden for a single
+    instance with a subsection named after the connection, for example:
+
+        [performance]
+            max_workers = 8
+            [[prod]]
+                max_workers = 2
+    """
+    # Maximum number of concurrent requests/instances for bulk and fleet-wide operations
+    max_workers: int = 8
+    # HTTP timeouts, in seconds
+    http_timeout: int = 120
+    login_timeout: int = 20
+    # Maximum number of attempts for a retryable call (1 disables retries), and the most retries allowed as a fraction of
+    # all calls to an instance, so that a struggling server is not hit with a storm of retries
+    retry_attempts: int = 3
+    retry_budget: float = 0.2
+    # Stop calling an instance for circuit_breaker_seconds after circuit_breaker_failures consecutive connection failures,
+    # timeouts or 5xx responses (0 failures disables the circuit breaker)
+    circuit_breaker_failures: int = 5
+    circuit_breaker_seconds: float = 30
+    # Seconds to wait between status checks when polling for a long-running job
+    poll_interval: float = 5
+    # Minimum delay between batch reprocess requests, shared by every reprocessing job against the same instance
+    seconds_between_calls: float = 0.5
+    # Maximum API calls per second per instance for bulk operations, shared by every job in the process (0 = unlimited),
+    # and the number of calls allowed in a burst before that rate applies
+    rate_limit: float = 0
+    rate_burst: int = 10
+    # Connections kept open for reuse per host, shared by every session in the process (0 disables the shared pool)
+    pool_maxsize: int = 16
+    # Cache lifetimes, in seconds: saved authenticated sessions (0 disables reuse), and lhub's cached lookups
+    session_ttl: int = 3600
+    cache_seconds: int = 300
+
+    @classmethod
+    def from_config_section(cls, section: dict):
+        """Build from an INI section, converting strings to each field's type and ignoring blank values and subsections"""
+        return cls(**cls._convert_values(section))
+
+    @classmethod
+    def _convert_values(cls, section: dict):
+        values = {}
+        for _field in fields(cls):
+            value = section.get(_field.name)
+            if value is None or isinstance(value, dict) or str(value).strip() in ("", "None"):
+                continue
+            values[_field.name] = int(float(value)) if _field.type is int else _field.type(value)
+        return values
+
+    def for_instance(self, overrides: dict):
+        return replace(self, **self._convert_values(overrides or {}))
+
+
 @dataclass_json
 @dataclass
 class Preferences:
     main: _PreferenceMain = None
     commands: _PreferenceCommands = None
+    performance: _PreferencePerformance = None
 
     def __post_init__(self):
         self.preferences_file_name = PREFERENCES_FILE_NAME
         self.preferences_path = os.path.join(LHUB_CONFIG_PATH, self.preferences_file_name)
+        # Per-instance [performance] overrides, keyed by connection name
+        self.performance_overrides = {}
         self.get_preferences()
 
     def save_preferences_file(self):
-        dict_to_ini_file(self.to_dict(), self.preferences_path)
+        _preferences = self.to_dict()
+        _preferences["performance"].update(self.performance_overrides)
+        dict_to_ini_file(_preferences, self.preferences_path)
+
+    def performance_for(self, instance_name=None) -> _PreferencePerformance:
+        """Performance settings for one instance, with any instance-specific overrides applied"""
+        if instance_name and instance_name in self.performance_overrides:
+            return self.performance.for_instance(self.performance_overrides[instance_name])
+        return self.performance
 
     def get_preferences(self):
         if not os.path.exists(self.preferences_path):
             self.main = _PreferenceMain()
             self.commands = _PreferenceCommands()
+            self.performance = _PreferencePerformance()
+            Path(LHUB_CONFIG_PATH).mkdir(parents=True, exist_ok=True)
             self.save_preferences_file()
             return
 
@@ -58,6 +143,27 @@ class Preferences:
             self.commands = _PreferenceCommands(**{
                 k: v for k, v in preferences_obj.dict().get("commands", {}).items()
             })
+        if not self.performance:
+            _performance = preferences_obj.dict().get("performance", {})
+            self.performance = _PreferencePerformance.from_config_section(_performance)
+            self.performance_overrides = {k: v for k, v in _performance.items() if isinstance(v, dict)}
+
+
+_PREFERENCES: Preferences = None
+_PREFERENCES_LOCK = threading.Lock()
+
+
+def get_preferences(reload=False) -> Preferences:
+    """Preferences shared by the whole process; the preferences file is only read the first time this is called"""
+    global _PREFERENCES
+    with _PREFERENCES_LOCK:
+        if _PREFERENCES is None or reload:
+            _PREFERENCES = Preferences()
+        return _PREFERENCES
+
+
+def get_performance_preferences(instance_name=None) -> _PreferencePerformance:
+    return get_preferences().performance_for(instance_name)
 
 
 @dataclass_json
@@ -92,11 +198,16 @@ class Connection:
 
 
 class LhubConfig:
-    __full_config: ConfigObj = None
+    __full_config: dict = None
     credentials_file_name = CREDENTIALS_FILE_NAME
     __credentials_file_modified_time = None
+    secret_fields = ('password', 'api_key')
+
+    # Re-encrypt any secrets still stored in the legacy (RSA only) format whenever a credentials file is loaded. Can also
+    # be turned off with migrate_legacy_secrets = False in the [main] section of the preferences file.
+    migrate_legacy_secrets = True
 
-    def __init__(self, credentials_file_name=None, logger: ExpectedLoggerTypes = None, log_level=None):
+    def __init__(self, credentials_file_name=None, logger: ExpectedLoggerTypes = None, log_level=None, migrate_legacy_secrets: bool = None):
         self.__log = logger or generate_logger(name=__name__, level=log_level)
         if log_level:
             self.__log.setLevel(log_level)
@@ -108,13 +219,24 @@ class LhubConfig:
         if credentials_file_name and credentials_file_name != self.credentials_file_name:
             self.credentials_file_name = f"{CREDENTIALS_FILE_NAME}-{credentials_file_name}"
         self.credentials_path = os.path.join(LHUB_CONFIG_PATH, self.credentials_file_name)
+        self.encryption = EnvelopeEncryption(
+            Encryption(LHUB_CONFIG_PATH, logger=self.__log, log_level=log_level),
+            data_key_path=os.path.join(LHUB_CONFIG_PATH, f".{self.credentials_file_name}.datakey"),
+            logger=self.__log
+        )
+        if migrate_legacy_secrets is not None:
+            self.migrate_legacy_secrets = migrate_legacy_secrets
+        elif self.migrate_legacy_secrets:
+            self.migrate_legacy_secrets = get_preferences().main.migrate_legacy_secrets
         self.__load_credentials_file()
-        self.encryption = Encryption(LHUB_CONFIG_PATH, logger=self.__log, log_level=log_level)
+        self.agent = AgentClient.from_environment(logger=self.__log)
 
     def write_credential_file(self, explicit_config: dict = None):
         if explicit_config is None:
-            explicit_config = self.__full_config.dict()
+            explicit_config = self.__full_config
         dict_to_ini_file(explicit_config, self.credentials_path)
+        # Rebuild the parsed snapshot right away so that other LhubConfig objects (and processes) pick up the change
+        _ = load_ini_file(self.credentials_path, refresh=True)
         self.reload()
 
     def __load_credentials_file(self):
@@ -133,7 +255,39 @@ class LhubConfig:
             return
         self.__credentials_file_modified_time = file_modified
         self.__log.debug(f"Loading credential file: {self.credentials_file_name} [{self.credentials_path}]")
-        self.__full_config = ConfigObj(self.credentials_path)
+        self.__full_config = load_ini_file(self.credentials_path)
+        if self.migrate_legacy_secrets:
+            self.__migrate_legacy_secrets()
+
+    def __legacy_secret_fields(self, settings):
+        # Anything other than a section (e.g. a stray top-level value) holds no connection secrets
+        if not isinstance(settings, dict):
+            return []
+        return [k for k in self.secret_fields if settings.get(k) and not self.encryption.is_envelope(settings[k])]
+
+    def __has_legacy_secrets(self):
+        return any(self.__legacy_secret_fields(_settings) for _settings in self.__full_config.values())
+
+    def __migrate_legacy_secrets(self):
+        if not self.__has_legacy_secrets():
+            return
+        # Only one thread or process may rewrite the credentials file at a time
+        with file_lock(f"{self.credentials_path}.lock"):
+            # Another caller may have migrated the file while this one waited for the lock
+            self.__full_config = load_ini_file(self.credentials_path, refresh=True)
+            self.__credentials_file_modified_time = os.path.getmtime(self.credentials_path)
+            migrated = []
+            for instance_label, _settings in self.__full_config.items():
+                for k in self.__legacy_secret_fields(_settings):
+                    _settings[k] = self.encryption.encrypt_string(self.encryption.decrypt_string(_settings[k]))
+                    if instance_label not in migrated:
+                        migrated.append(instance_label)
+            if migrated:
+                # Keep the file exactly as it was, in case anything still needs the legacy format
+                backup_path = f"{self.credentials_path}.bak"
+                shutil.copy2(self.credentials_path, backup_path)
+                self.write_credential_file()
+                self.__log.info(f"Migrated {len(migrated)} stored connection(s) to the envelope encryption format: {', '.join(migrated)} (previous file saved as {backup_path})")
 
     @property
     def credential_file_changed(self):
@@ -173,20 +327,26 @@ class LhubConfig:
                 raise ConnectionNotFound(instance_label)
             self.__log.error(f"No connection found: {instance_label=}")
             return
-        # Make a copy of the dict, otherwise this will only work once, and it
-        # will fail with a decryption error any subsequent calls for the same instance
-        _credentials = {k: v for k, v in self.__full_config[instance_label].items()}
-        for k in _credentials:
-            if k in ('password', 'api_key'):
-                _credentials[k] = self.encryption.decrypt_string(_credentials[k])
+        _credentials = None
+        if self.agent:
+            _credentials = self.agent.get_credentials(self.credentials_path, instance_label, self.__credentials_file_modified_time)
+            if _credentials:
+                self.__log.debug(f"Credentials provided by agent: {instance_label=}")
+        if not _credentials:
+            # Make a copy of the dict, otherwise this will only work once, and it
+            # will fail with a decryption error any subsequent calls for the same instance
+            _credentials = {k: v for k, v in self.__full_config[instance_label].items()}
+            for k in _credentials:
+                if k in self.secret_fields:
+                    _credentials[k] = self.encryption.decrypt_string(_credentials[k])
+            if self.agent:
+                self.agent.put_credentials(self.credentials_path, instance_label, self.__credentials_file_modified_time, _credentials)
         return Connection(name=instance_label, **_credentials)
 
     def create_instance(self, instance_label, server=None, auth_type=None, api_key=None, username=None, password=None, verify_ssl=None):
 
         def verify_lhub_connection():
-            verify = True if verify_ssl is None else verify_ssl
-            self.__log.debug(f"Testing connectivity and authentication: {server=} {username=} {verify=}")
-            _ = LogicHub(hostname=server, username=username, password=password, api_key=api_key, verify_ssl=verify_ssl)
+            self.verify_connection(server=server, username=username, password=password, api_key=api_key, verify_ssl=verify_ssl)
 
         instance_label = instance_label.strip()
         if instance_label in self.__full_config:
@@ -254,8 +414,104 @@ class LhubConfig:
         connection_kwargs = {k: v for k, v in connection_kwargs.items() if v is not None}
         self.update_connection(**connection_kwargs)
 
+    def verify_connection(self, server, username=None, password=None, api_key=None, verify_ssl=None, timeout=None) -> LogicHub:
+        """
+        Log into a LogicHub server to make sure that the connection details work, then log straight back out
+
+        :return: the (logged out) session, which still holds cached details such as the server version
+        """
+        verify = True if verify_ssl is None else verify_ssl
+        self.__log.debug(f"Testing connectivity and authentication: {server=} {username=} {verify=}")
+        session = LogicHub(hostname=server, username=username, password=password, api_key=api_key, verify_ssl=verify, default_timeout=timeout)
+        if session.api.auth_type == 'password':
+            # Log out now rather than at exit, so that bulk imports do not leave hundreds of logouts queued up
+            atexit.unregister(session.api.close)
+            session.api.close()
+        return session
+
+    @staticmethod
+    def _parse_connection_row(row: dict):
+        """Normalize one row of a bulk import into the arguments expected by update_connection (secrets not yet encrypted)"""
+        row = {k.strip().lower(): v.strip() if isinstance(v, str) else v for k, v in row.items() if k}
+        instance_label = row.get("name") or row.get("instance_label") or row.get("label")
+        hostname = row.get("hostname") or row.get("server")
+        verify_ssl = row.get("verify_ssl")
+        if isinstance(verify_ssl, str):
+            verify_ssl = verify_ssl.lower() not in ("false", "no", "n", "0")
+        if not instance_label:
+            raise CLIValueError(message="No connection name provided")
+        if not hostname:
+            raise CLIValueError(message="No hostname provided")
+        connection = {"instance_label": instance_label, "hostname": hostname, "verify_ssl": False if verify_ssl is False else None}
+        if row.get("api_key"):
+            connection["api_key"] = row["api_key"]
+        elif row.get("username") and row.get("password"):
+            connection.update({"username": row["username"], "password": row["password"]})
+        else:
+            raise CLIValueError(message="Either an API key or a username and password are required")
+        return connection
+
+    def import_connections(self, connections: list, max_workers=None, overwrite=False, verify=True):
+        """
+        Add many connections at once. Connectivity is verified in parallel, and every connection that passes is saved
+        in a single write of the credentials file.
+
+        :param connections: list of dicts with a name, hostname, either api_key or username and password, and optionally verify_ssl
+        :param max_workers: maximum number of connections to verify at the same time
+        :param overwrite: replace existing connections with the same name instead of skipping them
+        :param verify: log into each server before saving it
+        :return: list of dicts summarizing the outcome of each row, in input order
+        """
+        report = []
+        pending = {}
+        for n in range(len(connections)):
+            _row_report = {"row": n + 1, "name": None, "hostname": None, "status": None, "error": None}
+            report.append(_row_report)
+            try:
+                _connection = self._parse_connection_row(connections[n])
+            except CLIValueError as err:
+                _row_report.update({"status": "failed", "error": err.message})
+                continue
+            _row_report.update({"name": _connection["instance_label"], "hostname": _connection["hostname"]})
+            if _connection["instance_label"] in [c["instance_label"] for c in pending.values()] or (_connection["instance_label"] in self.__full_config and not overwrite):
+                _row_report.update({"status": "skipped", "error": "A connection already exists by this name"})
+                continue
+            pending[n] = _connection
+
+        def verify_row(row_num):
+            _connection = pending[row_num]
+            self.verify_connection(
+                server=_connection["hostname"],
+                username=_connection.get("username"),
+                password=_connection.get("password"),
+                api_key=_connection.get("api_key"),
+                verify_ssl=_connection["verify_ssl"],
+            )
+
+        if verify and pending:
+            self.__log.info(f"Verifying {len(pending)} connection(s)")
+            for task in iter_completed(verify_row, list(pending.keys()), max_workers=max_workers):
+                if not task.successful:
+                    _error = task.error
+                    report[task.item]["error"] = "SSL certificate verification failed" if isinstance(_error, SSLError) else getattr(_error, "message", None) or repr(_error)
+                    report[task.item]["status"] = "failed"
+                    del pending[task.item]
+
+        for n, _connection in pending.items():
+            for k in self.secret_fields:
+                if _connection.get(k):
+                    _connection[k] = self.encryption.encrypt_string(_connection[k])
+            instance_label = _connection.pop("instance_label")
+            self.__full_config[instance_label] = {k: v for k, v in _connection.items() if v is not None}
+            report[n]["status"] = "imported"
+
+        if pending:
+            self.write_credential_file()
+            self.__log.info(f"Saved {len(pending)} connection(s)")
+        return report
+
     def list_configured_instances(self):
-        return sorted(self.__full_config.dict().keys())
+        return sorted(self.__full_config.keys())
 
     def print_configured_instances(self):
         instances = self.list_configured_instances()
@@ -274,10 +530,10 @@ class LhubConfig:
 
 class LogicHubConnection:
     __instance = None
-    # preferences: Preferences = None
     credentials = None
 
     config: LhubConfig = None
+    preferences: Preferences = None
     log: ExpectedLoggerTypes
 
     def __init__(self, instance_alias=None, logger: ExpectedLoggerTypes = None, log_level=None, **kwargs):
@@ -285,9 +541,8 @@ class LogicHubConnection:
         if log_level and hasattr(self.log, "setLevel"):
             self.log.setLevel(log_level)
         self.config = LhubConfig(logger=self.log, **kwargs)
-        # ToDo Not yet used, but the groundwork has been laid. Revisit and enable this when ready to begin putting it to use.
-        # if not self.preferences:
-        #     self.preferences = Preferences()
+        if not self.preferences:
+            self.preferences = get_preferences()
         if instance_alias:
             self.instance = instance_alias
 
@@ -313,5 +568,12 @@ class LogicHubConnection:
         self.__instance = name
         self.credentials = _new_credentials
 
+    @property
+    def performance(self) -> _PreferencePerformance:
+        try:
+            return self.preferences.performance_for(self.instance)
+        except ValueError:
+            return self.preferences.performance_for()
+
     def exists(self, name) -> bool:
         return self.config.exists(name=name)
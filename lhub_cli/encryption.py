@@ -1,18 +1,60 @@
+import json
 import os
+import threading
+import time
 import rsa
 import base64
+from cryptography.fernet import Fernet, InvalidToken
 from .exceptions.encryption import EncryptionKeyError
 from .exceptions.app import PathNotFound
 from .log import generate_logger, ExpectedLoggerTypes
 
 # https://stuvel.eu/python-rsa-doc/usage.html#generating-keys
 
+# Secrets stored in the envelope format carry this prefix. Anything without it is a legacy value encrypted directly with RSA.
+ENVELOPE_PREFIX = "lhenc2:"
+ENVELOPE_VERSION = 2
+
+# Parsed keys are shared by every Encryption/EnvelopeEncryption object in the process.
+# Entries are keyed by path and modified time, so replacing a key file on disk is picked up automatically.
+_KEY_CACHE = {}
+_KEY_CACHE_LOCK = threading.Lock()
+_KEY_GENERATION_LOCK = threading.Lock()
+
+
+def _load_cached_key(path, loader):
+    """
+    Load and parse a key file once per process
+
+    :param path: path to the key file
+    :param loader: callable which accepts the file contents (bytes) and returns the parsed key, e.g. rsa.PublicKey.load_pkcs1
+    """
+    if isinstance(loader, type):
+        loader = loader.load_pkcs1
+    cache_key = (os.path.abspath(path), os.stat(path).st_mtime_ns)
+    with _KEY_CACHE_LOCK:
+        if cache_key in _KEY_CACHE:
+            return _KEY_CACHE[cache_key]
+    with open(path, mode='rb') as _key_file:
+        _key = loader(_key_file.read())
+    with _KEY_CACHE_LOCK:
+        # Drop anything cached for an older version of the same file
+        for _old_key in [k for k in _KEY_CACHE if k[0] == cache_key[0]]:
+            del _KEY_CACHE[_old_key]
+        _KEY_CACHE[cache_key] = _key
+    return _key
+
 
 class Encryption:
     public_default = ".lhub.pub"
     private_default = ".lhub.pem"
+    default_key_size = 4096
+    # Number of processes used to search for primes when generating keys. rsa.newkeys is single-core when this is 1.
+    # More than 1 starts worker processes, which (with the "spawn" start method) re-import the calling script's main
+    # module, so it is only used when a caller asks for it explicitly (see script_repo/keygen.py).
+    default_poolsize = 1
 
-    def __init__(self, key_location, private_key_name=None, pub_file_name=None, logger: ExpectedLoggerTypes = None, log_level=None):
+    def __init__(self, key_location, private_key_name=None, pub_file_name=None, logger: ExpectedLoggerTypes = None, log_level=None, key_size=None, poolsize=None):
         self.__log = logger if logger else generate_logger(name=__name__, level=log_level)
         if log_level:
             self.__log.setLevel(log_level)
@@ -28,21 +70,60 @@ class Encryption:
             key_location,
             pub_file_name.strip() if pub_file_name else self.public_default
         )
+        self.key_size = int(key_size or self.default_key_size)
+        self.poolsize = int(poolsize or self.default_poolsize)
+        # Keys are not read until they are actually needed (see load_keys)
+
+    @property
+    def _public_key(self) -> rsa.PublicKey:
+        self.load_keys()
+        return _load_cached_key(self.public_key_path, rsa.PublicKey)
 
-        self._public_key = None
-        self.__private_key = None
+    @property
+    def __private_key(self) -> rsa.PrivateKey:
         self.load_keys()
+        return _load_cached_key(self.private_key_path, rsa.PrivateKey)
+
+    @property
+    def keys_exist(self):
+        return os.path.exists(self.private_key_path) and os.path.exists(self.public_key_path)
+
+    def generate_keys(self, key_size=None, poolsize=None):
+        """
+        Generate and save a new key pair
+
+        :param key_size: key size in bits (default: self.key_size)
+        :param poolsize: number of processes used for prime generation (default: self.poolsize)
+        """
+        key_size = int(key_size or self.key_size)
+        poolsize = int(poolsize or self.poolsize)
+        with _KEY_GENERATION_LOCK:
+            if os.path.exists(self.private_key_path) or os.path.exists(self.public_key_path):
+                raise EncryptionKeyError(f"Encryption keys already exist in {self.key_location}")
+            self.__log.info(f"Generating {key_size}-bit encryption keys using {poolsize} process(es). Please wait...")
+            _public_key, _private_key = rsa.newkeys(key_size, poolsize=poolsize)
+            # Write the private key first and restrict it to the current user
+            _fd = os.open(self.private_key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(_fd, "w") as _key_file:
+                _key_file.write(_private_key.save_pkcs1().decode())
+            with open(self.public_key_path, "w+") as _key_file:
+                _key_file.write(_public_key.save_pkcs1().decode())
+            self.__log.info("Keys successfully generated.")
 
     def load_keys(self):
+        """Make sure that both keys exist, generating a new key pair if neither is found"""
+        if self.keys_exist:
+            return
+
         # If no existing keys are found stored at the expected location, generate new ones
         if not os.path.exists(self.private_key_path) and not os.path.exists(self.public_key_path):
-            self.__log.info("Existing encryption keys not found. Please wait while new keys are generated.")
-            self._public_key, self.__private_key = rsa.newkeys(4096)
-            with open(self.public_key_path, "w+") as _key_file:
-                _key_file.write(self._public_key.save_pkcs1().decode())
-            with open(self.private_key_path, "w+") as _key_file:
-                _key_file.write(self.__private_key.save_pkcs1().decode())
-            self.__log.info("Keys successfully generated.")
+            self.__log.info("Existing encryption keys not found.")
+            try:
+                self.generate_keys()
+            except EncryptionKeyError:
+                # Another thread generated the keys while this one was waiting for the lock
+                if not self.keys_exist:
+                    raise
             return
 
         if not os.path.exists(self.private_key_path):
@@ -50,14 +131,6 @@ class Encryption:
         if not os.path.exists(self.public_key_path):
             raise EncryptionKeyError(f"Found private key ({self.private_key_path}) but could not find public key ({self.public_key_path})")
 
-        with open(self.public_key_path, mode='rb') as _key_file:
-            _public_key_text = _key_file.read()
-        with open(self.private_key_path, mode='rb') as _key_file:
-            _private_key_text = _key_file.read()
-        self._public_key = rsa.PublicKey.load_pkcs1(_public_key_text)
-        self.__private_key = rsa.PrivateKey.load_pkcs1(_private_key_text)
-        return
-
     def encrypt_string(self, var_str):
         _var_bytes = var_str.encode()
         _var_encrypted = rsa.encrypt(_var_bytes, self._public_key)
@@ -69,3 +142,86 @@ class Encryption:
         _var_decoded = base64.b64decode(_var_bytes)
         _var_decrypted = rsa.decrypt(_var_decoded, self.__private_key)
         return _var_decrypted.decode()
+
+
+class EnvelopeEncryption:
+    """
+    Encrypt secrets with a symmetric data key (Fernet), and store that data key wrapped with the RSA keys from Encryption.
+
+    Only the data key ever goes through RSA, so the expensive private key operation happens once per credentials
+    file rather than once per secret. Legacy values which were encrypted directly with RSA can still be decrypted.
+    """
+
+    def __init__(self, encryption: Encryption, data_key_path, logger: ExpectedLoggerTypes = None):
+        self.__log = logger or generate_logger(name=__name__)
+        self.encryption = encryption
+        self.data_key_path = data_key_path
+        self.__fernet = None
+
+    @staticmethod
+    def is_envelope(var_str):
+        return isinstance(var_str, str) and var_str.startswith(ENVELOPE_PREFIX)
+
+    def __unwrap_data_key(self, key_file_text):
+        _key_info = json.loads(key_file_text)
+        if _key_info.get("version") != ENVELOPE_VERSION:
+            raise EncryptionKeyError(f"Unsupported data key version in {self.data_key_path}: {_key_info.get('version')}")
+        return Fernet(self.encryption.decrypt_string(_key_info["wrapped_key"]).encode())
+
+    def __load_data_key(self, create=False):
+        if self.__fernet:
+            return self.__fernet
+        if os.path.exists(self.data_key_path):
+            # Unwrapping requires an RSA decryption, so the result is shared across the process just like the RSA keys
+            try:
+                self.__fernet = _load_cached_key(self.data_key_path, self.__unwrap_data_key)
+            except ValueError:
+                # Another process created the file but has not finished writing it yet
+                self.__fernet = self.__wait_for_data_key()
+        elif create:
+            self.__fernet = self.__create_data_key()
+        else:
+            raise EncryptionKeyError(f"Data key not found: {self.data_key_path}")
+        return self.__fernet
+
+    def __create_data_key(self):
+        self.__log.debug(f"Generating new data key: {self.data_key_path}")
+        _data_key = Fernet.generate_key()
+        _key_info = {"version": ENVELOPE_VERSION, "wrapped_key": self.encryption.encrypt_string(_data_key.decode())}
+        try:
+            # O_EXCL: never replace a key which another thread or process already created and may have used
+            _fd = os.open(self.data_key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            self.__log.debug(f"Data key was created by another process; using that one instead: {self.data_key_path}")
+            return self.__wait_for_data_key()
+        with os.fdopen(_fd, "w") as _key_file:
+            json.dump(_key_info, _key_file)
+            _key_file.flush()
+            os.fsync(_key_file.fileno())
+        return Fernet(_data_key)
+
+    def __wait_for_data_key(self, timeout=10):
+        """Load a data key which another writer created, allowing it a moment to finish writing the file"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with open(self.data_key_path) as _key_file:
+                    return self.__unwrap_data_key(_key_file.read())
+            except ValueError:
+                # Still empty or partly written
+                if time.monotonic() > deadline:
+                    raise EncryptionKeyError(f"Data key is incomplete or corrupt: {self.data_key_path}")
+                time.sleep(0.05)
+
+    def encrypt_string(self, var_str):
+        _var_encrypted = self.__load_data_key(create=True).encrypt(var_str.encode())
+        return ENVELOPE_PREFIX + _var_encrypted.decode()
+
+    def decrypt_string(self, var_str):
+        if not self.is_envelope(var_str):
+            return self.encryption.decrypt_string(var_str)
+        try:
+            _var_decrypted = self.__load_data_key().decrypt(var_str[len(ENVELOPE_PREFIX):].encode())
+        except InvalidToken:
+            raise EncryptionKeyError(f"Secret could not be decrypted with data key {self.data_key_path}")
+        return _var_decrypted.decode()
@@ -64,3 +64,15 @@ class UserNotFound(InvalidUserInput):
 
     def __init__(self, user, message=None, *args, **kwargs):
         super().__init__(message=message, input_var=user, *args, **kwargs)
+
+
+class CircuitOpen(BaseAppError):
+    """Calls to an instance are being skipped because it has failed repeatedly"""
+    message = "Instance is not responding; skipping calls until it recovers"
+
+    def __init__(self, instance=None, retry_after=None, message=None, *args, **kwargs):
+        self.instance = instance
+        self.retry_after = retry_after
+        if not message and instance:
+            message = f"{self.message} [{instance}]" + (f" (next attempt in {retry_after:.0f} seconds)" if retry_after else "")
+        super().__init__(message=message, input_var=instance, *args, **kwargs)
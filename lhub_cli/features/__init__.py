@@ -1 +1 @@
-from . import commands
+from . import commands, exporters, exports, health
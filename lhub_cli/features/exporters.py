@@ -0,0 +1,203 @@
+"""
+Export plugins: one small class per resource type, run by Actions.export_resources
+
+Each plugin lists the resources of its type, fetches one resource, and serializes it. Everything else (concurrency,
+rate limiting, retries, file naming, manifests and failure reporting) is handled by the shared engine, so adding a
+new resource type only takes a new subclass registered with @register_exporter.
+
+Types marked metadata_only have no endpoint in lhub for their full definitions, so what gets exported is the summary
+entry from the list endpoint. That is useful for inventory and change tracking, but not enough to restore a resource.
+"""
+
+import json
+from typing import Dict, List, Type
+
+from lhub import LogicHub
+from lhub.exceptions import LhBaseException
+
+from .exports import SerializedExport
+
+# Registered plugins by resource type, in the order a full export runs them
+EXPORTERS: Dict[str, Type["ResourceExporter"]] = {}
+
+
+def register_exporter(cls):
+    EXPORTERS[cls.resource_type] = cls
+    return cls
+
+
+def _data_list(result) -> list:
+    """Unwrap the nested {"data": {"data": [...]}} envelopes which LogicHub list endpoints use"""
+    while isinstance(result, dict) and result.get("data") is not None:
+        result = result["data"]
+    return result if isinstance(result, list) else []
+
+
+def _resource_field(resource: dict, field_name):
+    """Read a field from a listing entry, whether it sits at the top level or under "resource" (modules, integrations)"""
+    for container in (resource, resource.get("resource")):
+        if isinstance(container, dict) and container.get(field_name) not in (None, ""):
+            value = container[field_name]
+            # IDs are often wrapped, e.g. {"id": 123}
+            return value["id"] if isinstance(value, dict) and "id" in value else value
+    return None
+
+
+class ResourceExporter:
+    """
+    Base class for export plugins
+
+    Subclasses set resource_type and implement list_resources(). By default the listing entry itself is the export;
+    override fetch() when a resource needs its own API call (and set remote_fetch, so that the call is rate limited,
+    retried and counted towards adaptive concurrency), and serialize() when the content is not plain JSON.
+    """
+
+    # Used in folder names, store trees and manifests
+    resource_type: str = None
+    # Human readable name for logs
+    label: str = None
+    # Whether fetch() calls the API
+    remote_fetch = False
+    # Whether the export is only the listing's summary entry rather than a full, restorable definition
+    metadata_only = False
+    # Runtime fields which change without the resource itself changing. They are left out of JSON exports, otherwise
+    # every run would produce a new content hash and incremental exports would report the resource as changed.
+    volatile_fields = ()
+
+    def __init__(self, session: LogicHub):
+        self.session = session
+
+    def list_resources(self) -> List[dict]:
+        raise NotImplementedError
+
+    def resource_id(self, resource: dict):
+        return _resource_field(resource, "id")
+
+    def resource_name(self, resource: dict):
+        return _resource_field(resource, "name") or str(self.resource_id(resource))
+
+    def fetch(self, resource: dict):
+        return resource
+
+    def without_volatile_fields(self, payload):
+        """Copy of a payload with volatile_fields removed, both at the top level and under "resource" """
+        if not self.volatile_fields or not isinstance(payload, dict):
+            return payload
+        payload = {k: v for k, v in payload.items() if k not in self.volatile_fields}
+        if isinstance(payload.get("resource"), dict):
+            payload["resource"] = {k: v for k, v in payload["resource"].items() if k not in self.volatile_fields}
+        return payload
+
+    def serialize(self, resource: dict, payload) -> SerializedExport:
+        return SerializedExport("json", content=json.dumps(self.without_volatile_fields(payload), sort_keys=True).encode())
+
+
+@register_exporter
+class PlaybookExporter(ResourceExporter):
+    resource_type = "flows"
+    label = "playbook"
+    remote_fetch = True
+
+    def list_resources(self):
+        return self.session.actions.list_playbooks()
+
+    def fetch(self, resource):
+        return self.session.api.export_playbook(self.resource_id(resource))
+
+    def serialize(self, resource, payload):
+        file_type = payload["result"]["fileType"]
+        if file_type not in ("json", "zip"):
+            # Should never happen, but just in case...
+            raise LhBaseException(f"\nERROR: Unknown file type. You will need to download manually: {self.resource_name(resource)} ({self.resource_id(resource)})")
+        return SerializedExport(file_type, content_b64=payload["result"]["contentB64"])
+
+
+@register_exporter
+class CustomListExporter(ResourceExporter):
+    resource_type = "custom_lists"
+    label = "custom list"
+    remote_fetch = True
+    page_size = 10_000
+
+    def list_resources(self):
+        results, _ = self.session.actions.list_custom_lists()
+        return _data_list(results)
+
+    def fetch(self, resource):
+        rows = []
+        while True:
+            page = _data_list(self.session.api.get_custom_list_data(self.resource_id(resource), limit=self.page_size, offset=len(rows)))
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+        return {"definition": resource, "data": rows}
+
+
+@register_exporter
+class EventTypeExporter(ResourceExporter):
+    resource_type = "event_types"
+    label = "event type"
+    metadata_only = True
+
+    def list_resources(self):
+        return _data_list(self.session.actions.list_event_types())
+
+
+@register_exporter
+class CommandExporter(ResourceExporter):
+    resource_type = "commands"
+    label = "command"
+    metadata_only = True
+
+    def list_resources(self):
+        return _data_list(self.session.actions.list_commands())
+
+
+@register_exporter
+class ModuleExporter(ResourceExporter):
+    resource_type = "modules"
+    label = "module"
+    metadata_only = True
+
+    def list_resources(self):
+        modules, _ = self.session.actions.list_modules()
+        return modules
+
+
+@register_exporter
+class IntegrationExporter(ResourceExporter):
+    resource_type = "integrations"
+    label = "integration"
+    metadata_only = True
+
+    def list_resources(self):
+        integrations, _ = self.session.actions.list_integrations()
+        return integrations
+
+
+@register_exporter
+class BaselineExporter(ResourceExporter):
+    resource_type = "baselines"
+    label = "baseline"
+    metadata_only = True
+    # Updated by the server as baselines are (re)computed
+    volatile_fields = ("baseline_config_status",)
+
+    def list_resources(self):
+        return _data_list(self.session.actions.list_baselines())
+
+
+@register_exporter
+class DashboardExporter(ResourceExporter):
+    # ToDo Token auth not supported for dashboards as of 2022-05-05 (m94)
+    resource_type = "dashboards"
+    label = "dashboard"
+    remote_fetch = True
+
+    def list_resources(self):
+        return _data_list(self.session.actions.list_dashboards())
+
+    def fetch(self, resource):
+        # Includes the dashboard's widgets
+        result = self.session.api.get_dashboard(self.resource_id(resource))
+        return result.get("result", result) if isinstance(result, dict) else result
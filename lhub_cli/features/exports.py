@@ -0,0 +1,528 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tarfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..common.files import Base64Reader, atomic_write, iter_base64_decode, link_or_copy, pretty_print_json_file, write_base64_to_file, write_bytes_to_file
+
+MANIFEST_FILE_NAME = "_manifest.json"
+MANIFEST_VERSION = 1
+ARCHIVE_MANIFEST_NAME = "manifest.json"
+
+# Supported archive compression, mapped to the file extension used
+ARCHIVE_FORMATS = {"gz": "tar.gz", "xz": "tar.xz"}
+
+# Fields which LogicHub has used for a resource's last-modified time, in order of preference
+LAST_MODIFIED_FIELDS = ("lastUpdated", "lastModified", "lastUpdatedAt", "modifiedAt", "updatedAt")
+
+
+def find_last_modified(resource: dict):
+    """Return the last-modified value from a resource listing, if the server provides one"""
+    for field_name in LAST_MODIFIED_FIELDS:
+        if resource.get(field_name) not in (None, ""):
+            return resource[field_name]
+    return None
+
+
+def _timestamp():
+    return time.strftime("%Y-%m-%dT%H:%M:%S%z")
+
+
+class ExportManifest:
+    """
+    Record of what an export folder contains, saved as _manifest.json alongside the exported files
+
+    Each entry is keyed by resource ID and holds the resource name, file name, size, sha256 of the content as exported
+    by the server, the server's last-modified value (when available), and when the content was downloaded. Later runs
+    use it to skip resources which have not changed.
+    """
+
+    def __init__(
+            self, folder, resource_type, server=None, server_version=None, options: dict = None,
+            entries: Dict[str, dict] = None, exported_at=None, manifest_path=None):
+        self.folder = folder
+        self.__manifest_path = manifest_path
+        self.resource_type = resource_type
+        self.server = server
+        self.server_version = server_version
+        self.options = options or {}
+        self.entries = entries or {}
+        self.exported_at = exported_at or _timestamp()
+        self.changes = {}
+
+    @property
+    def path(self):
+        return self.__manifest_path or os.path.join(self.folder, MANIFEST_FILE_NAME)
+
+    def file_path(self, resource_id) -> Optional[str]:
+        entry = self.entries.get(str(resource_id))
+        return os.path.join(self.folder, entry["file"]) if entry else None
+
+    def add(self, resource_id, name, file_name, sha256, size, last_modified=None, exported_at=None):
+        self.entries[str(resource_id)] = {
+            "name": name,
+            "file": file_name,
+            "sha256": sha256,
+            "size": size,
+            "last_modified": last_modified,
+            "exported_at": exported_at or _timestamp(),
+        }
+
+    def compare(self, previous: "ExportManifest", current_ids: Iterable = None) -> Dict[str, list]:
+        """
+        Compare with a previous manifest, and store the result in self.changes
+
+        :param previous: manifest from an earlier run (or None, in which case everything is new)
+        :param current_ids: every resource ID that exists on the server now; anything else in the previous manifest counts as removed
+        :return: dict of resource ID lists: new, changed, unchanged and removed
+        """
+        previous_entries = previous.entries if previous else {}
+        changes = {"new": [], "changed": [], "unchanged": [], "removed": []}
+        for resource_id, entry in self.entries.items():
+            if resource_id not in previous_entries:
+                changes["new"].append(resource_id)
+            elif previous_entries[resource_id]["sha256"] != entry["sha256"]:
+                changes["changed"].append(resource_id)
+            else:
+                changes["unchanged"].append(resource_id)
+        current_ids = set(str(i) for i in current_ids) if current_ids is not None else set(self.entries)
+        changes["removed"] = sorted(i for i in previous_entries if i not in current_ids)
+        self.changes = changes
+        return changes
+
+    def to_dict(self):
+        return {
+            "version": MANIFEST_VERSION,
+            "resource_type": self.resource_type,
+            "server": self.server,
+            "server_version": self.server_version,
+            "exported_at": self.exported_at,
+            "options": self.options,
+            "changes": self.changes,
+            "resources": dict(sorted(self.entries.items())),
+        }
+
+    def save(self):
+        with atomic_write(self.path, "w") as _file:
+            json.dump(self.to_dict(), _file, indent=2)
+
+    @classmethod
+    def load(cls, folder, manifest_path=None) -> Optional["ExportManifest"]:
+        try:
+            with open(manifest_path or os.path.join(folder, MANIFEST_FILE_NAME)) as _file:
+                data = json.load(_file)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(
+            folder=folder,
+            resource_type=data.get("resource_type"),
+            server=data.get("server"),
+            server_version=data.get("server_version"),
+            options=data.get("options"),
+            entries=data.get("resources"),
+            exported_at=data.get("exported_at"),
+            manifest_path=manifest_path,
+        )
+
+    @classmethod
+    def find_latest(cls, parent_folder, folder_prefix, exclude=None) -> Optional["ExportManifest"]:
+        """Find the most recent export folder under parent_folder whose name starts with folder_prefix and has a manifest"""
+        if not os.path.isdir(parent_folder):
+            return None
+        exclude = os.path.abspath(exclude) if exclude else None
+        latest = None
+        for folder_name in os.listdir(parent_folder):
+            folder = os.path.join(parent_folder, folder_name)
+            if not folder_name.startswith(folder_prefix) or os.path.abspath(folder) == exclude:
+                continue
+            manifest = cls.load(folder)
+            if manifest and (latest is None or os.path.getmtime(manifest.path) > os.path.getmtime(latest.path)):
+                latest = manifest
+        return latest
+
+
+class ContentStore:
+    """
+    Content-addressed store for exports, shared by every instance and every run
+
+    Layout:
+        <root>/blobs/<first 2 characters of sha256>/<sha256>    exported content, stored once no matter how many
+                                                                instances or runs contain it
+        <root>/runs/<run name>/<server>_<resource type>.json    one tree per instance per run: an export manifest
+                                                                whose entries point at blobs by sha256
+
+    Disk usage and writes grow with actual changes rather than with instance count × runs. Use checkout() to turn a
+    tree back into a normal export folder, and gc() to drop old runs along with the blobs only they referenced.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blobs_folder = os.path.join(root, "blobs")
+        self.runs_folder = os.path.join(root, "runs")
+
+    def blob_path(self, sha256) -> str:
+        return os.path.join(self.blobs_folder, sha256[:2], sha256)
+
+    def has(self, sha256) -> bool:
+        return os.path.exists(self.blob_path(sha256))
+
+    def touch(self, sha256):
+        """Mark a blob as in use, so that gc() running at the same time leaves it alone until its tree is saved"""
+        try:
+            os.utime(self.blob_path(sha256))
+        except OSError:
+            pass
+
+    def put_base64(self, content_b64: str) -> Tuple[int, str, bool]:
+        """
+        Add base64 content to the store, writing it only if an identical blob is not stored already
+
+        :return: tuple of (decoded size, sha256 hex digest, whether a new blob was written)
+        """
+        # Hash first without touching the disk; in the common case the blob already exists and nothing is written
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter_base64_decode(content_b64):
+            digest.update(chunk)
+            size += len(chunk)
+        sha256 = digest.hexdigest()
+        if self.has(sha256):
+            self.touch(sha256)
+            return size, sha256, False
+        self.__write_blob(sha256, write_base64_to_file, content_b64)
+        return size, sha256, True
+
+    def put_bytes(self, data: bytes) -> Tuple[int, str, bool]:
+        """Same as put_base64(), for content which is already decoded"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.has(sha256):
+            self.touch(sha256)
+            return len(data), sha256, False
+        self.__write_blob(sha256, write_bytes_to_file, data)
+        return len(data), sha256, True
+
+    def __write_blob(self, sha256, writer, content):
+        blob_path = self.blob_path(sha256)
+        for attempt in range(3):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            try:
+                return writer(content, blob_path)
+            except FileNotFoundError:
+                # gc() removed the (empty) prefix folder between creating it and writing into it
+                if attempt == 2:
+                    raise
+
+    def tree_path(self, run_name, server, resource_type) -> str:
+        return os.path.join(self.runs_folder, run_name, f"{server}_{resource_type}.json")
+
+    def new_tree(self, run_name, server, resource_type, server_version=None, options: dict = None) -> ExportManifest:
+        """Start a tree for one instance in one run (saving it replaces any earlier tree for the same instance and run)"""
+        os.makedirs(os.path.join(self.runs_folder, run_name), exist_ok=True)
+        return ExportManifest(
+            folder=self.blobs_folder, resource_type=resource_type, server=server, server_version=server_version,
+            options=options, manifest_path=self.tree_path(run_name, server, resource_type))
+
+    def run_modified_time(self, run_name) -> float:
+        """When a run was last written to: its newest tree, or the run folder itself if it has none"""
+        run_folder = os.path.join(self.runs_folder, run_name)
+        mtimes = [os.path.getmtime(os.path.join(run_folder, f)) for f in os.listdir(run_folder)]
+        return max(mtimes, default=os.path.getmtime(run_folder))
+
+    def list_runs(self) -> List[str]:
+        """Run names, oldest first (by when they were last written, since custom run names need not sort by date)"""
+        if not os.path.isdir(self.runs_folder):
+            return []
+        runs = [f for f in os.listdir(self.runs_folder) if os.path.isdir(os.path.join(self.runs_folder, f))]
+        return sorted(runs, key=lambda run_name: (self.run_modified_time(run_name), run_name))
+
+    def iter_trees(self, run_name=None) -> Iterable[ExportManifest]:
+        for _run_name in [run_name] if run_name else self.list_runs():
+            run_folder = os.path.join(self.runs_folder, _run_name)
+            if not os.path.isdir(run_folder):
+                continue
+            for file_name in sorted(os.listdir(run_folder)):
+                if file_name.endswith(".json"):
+                    tree = ExportManifest.load(self.blobs_folder, manifest_path=os.path.join(run_folder, file_name))
+                    if tree:
+                        yield tree
+
+    def find_latest_tree(self, server, resource_type, exclude_run=None) -> Optional[ExportManifest]:
+        """Most recent tree for an instance and resource type, from any run other than exclude_run"""
+        latest = None
+        for run_name in self.list_runs():
+            if run_name == exclude_run:
+                continue
+            tree = ExportManifest.load(self.blobs_folder, manifest_path=self.tree_path(run_name, server, resource_type))
+            if tree and (latest is None or os.path.getmtime(tree.path) > os.path.getmtime(latest.path)):
+                latest = tree
+        return latest
+
+    def checkout(self, tree: ExportManifest, folder) -> int:
+        """
+        Recreate a normal export folder (named files plus _manifest.json) from a tree, hardlinking blobs where possible
+
+        :return: number of files written
+        """
+        os.makedirs(folder, exist_ok=True)
+        for entry in tree.entries.values():
+            link_or_copy(self.blob_path(entry["sha256"]), os.path.join(folder, entry["file"]))
+        ExportManifest(
+            folder=folder, resource_type=tree.resource_type, server=tree.server, server_version=tree.server_version,
+            options=tree.options, entries=tree.entries, exported_at=tree.exported_at).save()
+        return len(tree.entries)
+
+    def gc(self, keep_runs: int = None, older_than_days: float = None, grace_seconds: float = 86400, dry_run=False) -> dict:
+        """
+        Remove old runs, then delete every blob which no remaining tree points at (and any prefix folder left empty)
+
+        :param keep_runs: keep only this many of the newest runs
+        :param older_than_days: remove runs whose newest tree was saved more than this many days ago
+        :param grace_seconds: never delete blobs written or reused more recently than this, since an export which is
+            still running has not saved its tree yet
+        :param dry_run: only report what would be removed
+        :return: dict of counts: runs_removed, blobs_removed, bytes_freed, blobs_kept
+        """
+        runs = self.list_runs()
+        remove = set()
+        if keep_runs is not None:
+            remove.update(runs[:max(0, len(runs) - keep_runs)])
+        if older_than_days is not None:
+            cutoff = time.time() - older_than_days * 86400
+            remove.update(run_name for run_name in runs if self.run_modified_time(run_name) < cutoff)
+        if not dry_run:
+            for run_name in remove:
+                shutil.rmtree(os.path.join(self.runs_folder, run_name))
+
+        referenced = set()
+        for run_name in runs:
+            if run_name not in remove:
+                for tree in self.iter_trees(run_name):
+                    referenced.update(entry["sha256"] for entry in tree.entries.values())
+
+        stats = {"runs_removed": len(remove), "blobs_removed": 0, "bytes_freed": 0, "blobs_kept": 0}
+        grace_cutoff = time.time() - grace_seconds
+        if os.path.isdir(self.blobs_folder):
+            for prefix in os.listdir(self.blobs_folder):
+                prefix_folder = os.path.join(self.blobs_folder, prefix)
+                for sha256 in os.listdir(prefix_folder):
+                    blob_path = os.path.join(prefix_folder, sha256)
+                    if sha256 in referenced or sha256.endswith(".tmp") or os.path.getmtime(blob_path) > grace_cutoff:
+                        stats["blobs_kept"] += 1
+                        continue
+                    stats["blobs_removed"] += 1
+                    stats["bytes_freed"] += os.path.getsize(blob_path)
+                    if not dry_run:
+                        os.remove(blob_path)
+                if not dry_run:
+                    try:
+                        # Only succeeds once the prefix folder is empty
+                        os.rmdir(prefix_folder)
+                    except OSError:
+                        pass
+        return stats
+
+
+class SerializedExport:
+    """Exported content for one resource, either already decoded or still base64 encoded as served"""
+
+    def __init__(self, file_type, content: bytes = None, content_b64: str = None):
+        if (content is None) == (content_b64 is None):
+            raise ValueError("Exactly one of content or content_b64 is required")
+        self.file_type = file_type
+        self.content = content
+        self.content_b64 = content_b64
+
+
+class FolderDestination:
+    """Write exports as named files into one folder per resource type, alongside a _manifest.json"""
+
+    def __init__(self, manifest: ExportManifest, previous: ExportManifest = None, pretty=False):
+        self.manifest = manifest
+        self.previous = previous
+        self.pretty = pretty
+
+    @property
+    def description(self):
+        return self.manifest.folder
+
+    @property
+    def failures_log(self):
+        return os.path.join(self.manifest.folder, "_FAILURES.log")
+
+    def previous_content_path(self, entry: dict):
+        return os.path.join(self.previous.folder, entry["file"])
+
+    def carry_forward(self, entry: dict):
+        link_or_copy(self.previous_content_path(entry), os.path.join(self.manifest.folder, entry["file"]))
+
+    def write(self, file_name, export: SerializedExport) -> Tuple[int, str]:
+        file_path = os.path.join(self.manifest.folder, file_name)
+        if export.content_b64 is not None:
+            # Decode in chunks straight to disk rather than holding a second, decoded copy of the export in memory
+            size, sha256 = write_base64_to_file(export.content_b64, file_path)
+        else:
+            size, sha256 = write_bytes_to_file(export.content, file_path)
+        if self.pretty and export.file_type == "json":
+            pretty_print_json_file(file_path, indent=4)
+        return size, sha256
+
+    def close(self):
+        self.manifest.save()
+
+
+class StoreDestination:
+    """Write exports into a ContentStore, recording one tree per resource type"""
+
+    def __init__(self, store: ContentStore, manifest: ExportManifest, previous: ExportManifest = None):
+        self.store = store
+        self.manifest = manifest
+        self.previous = previous
+
+    @property
+    def description(self):
+        return self.manifest.path
+
+    @property
+    def failures_log(self):
+        return self.manifest.path[:-len(".json")] + "_FAILURES.log"
+
+    def previous_content_path(self, entry: dict):
+        return self.store.blob_path(entry["sha256"])
+
+    def carry_forward(self, entry: dict):
+        self.store.touch(entry["sha256"])
+
+    def write(self, file_name, export: SerializedExport) -> Tuple[int, str]:
+        # Only written if no instance or earlier run has exported identical content already
+        if export.content_b64 is not None:
+            size, sha256, _ = self.store.put_base64(export.content_b64)
+        else:
+            size, sha256, _ = self.store.put_bytes(export.content)
+        return size, sha256
+
+    def close(self):
+        self.manifest.save()
+
+
+class ExportArchive:
+    """
+    A single compressed tar archive which exports are streamed into as they are downloaded
+
+    Nothing is staged on disk: each resource is decoded straight into the compressed stream, so an export run is one
+    sequential write. A manifest.json entry covering every resource type is added last. The archive is written under a
+    temporary name and only moved into place by close(), so an interrupted run never leaves a truncated archive behind.
+    """
+
+    def __init__(self, path, compression="gz"):
+        if compression not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive compression: {compression}. Available: {', '.join(ARCHIVE_FORMATS)}")
+        self.path = path
+        self.__temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.__lock = threading.Lock()
+        self.__file = open(self.__temp_path, "wb")
+        # Stream mode ("w|"), so tarfile never seeks back and the output is written strictly in order
+        self.__tar = tarfile.open(fileobj=self.__file, mode=f"w|{compression}")
+        self.manifests: Dict[str, ExportManifest] = {}
+        self.closed = False
+
+    def add(self, name, file_obj, size: int):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        # Workers finish in any order, but the tar stream can only take one file at a time
+        with self.__lock:
+            if self.closed:
+                # A worker still running after the export was aborted
+                raise ValueError(f"Archive is already closed: {self.path}")
+            self.__tar.addfile(info, file_obj)
+
+    def close(self, failures: dict = None):
+        """Add manifest.json, then finish the archive and move it into place"""
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "exported_at": _timestamp(),
+            "resource_types": {t: {"folder": m.folder, **m.to_dict()} for t, m in self.manifests.items()},
+            "failures": {t: {str(k): v for k, v in f.items()} for t, f in (failures or {}).items() if f},
+        }
+        data = json.dumps(manifest, indent=2).encode()
+        try:
+            self.add(ARCHIVE_MANIFEST_NAME, io.BytesIO(data), len(data))
+            # Held until the end, so that no straggling worker can write after the trailer
+            with self.__lock:
+                self.closed = True
+                self.__tar.close()
+                self.__file.close()
+                os.replace(self.__temp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """Discard a partly written archive"""
+        # Workers may still be streaming an entry (iter_completed does not wait for them when aborting)
+        with self.__lock:
+            self.closed = True
+            try:
+                self.__tar.close()
+            except (OSError, tarfile.TarError, ValueError):
+                # Nothing useful can be salvaged from a broken stream; it is deleted below either way
+                pass
+            finally:
+                self.__file.close()
+                if os.path.exists(self.__temp_path):
+                    os.remove(self.__temp_path)
+
+
+class ArchiveDestination:
+    """Stream one resource type's exports into a folder inside an ExportArchive"""
+
+    def __init__(self, archive: ExportArchive, manifest: ExportManifest, pretty=False):
+        self.archive = archive
+        self.manifest = manifest
+        self.previous = None
+        self.pretty = pretty
+
+    @property
+    def description(self):
+        return f"{self.archive.path}:{self.manifest.folder}"
+
+    @property
+    def failures_log(self):
+        # Next to the archive, since failures are only known once their entries can no longer be added to it
+        base_path = self.archive.path
+        for extension in ARCHIVE_FORMATS.values():
+            if base_path.endswith(f".{extension}"):
+                base_path = base_path[:-len(extension) - 1]
+        return base_path + "_FAILURES.log"
+
+    def write(self, file_name, export: SerializedExport) -> Tuple[int, str]:
+        name = f"{self.manifest.folder}/{file_name}"
+        if self.pretty and export.file_type == "json":
+            # Reformatting needs the whole export in memory anyway
+            raw = export.content if export.content is not None else base64.b64decode(export.content_b64)
+            data = json.dumps(json.loads(raw), indent=4).encode()
+            self.archive.add(name, io.BytesIO(data), len(data))
+            return len(raw), hashlib.sha256(raw).hexdigest()
+        if export.content is not None:
+            self.archive.add(name, io.BytesIO(export.content), len(export.content))
+            return len(export.content), hashlib.sha256(export.content).hexdigest()
+        # tar headers need the size up front, so hash and measure in one pass and decode again while streaming
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in iter_base64_decode(export.content_b64):
+            digest.update(chunk)
+            size += len(chunk)
+        self.archive.add(name, Base64Reader(export.content_b64), size)
+        return size, digest.hexdigest()
+
+    def close(self):
+        self.archive.manifests[self.manifest.resource_type] = self.manifest
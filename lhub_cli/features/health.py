@@ -0,0 +1,89 @@
+import time
+
+from lhub.exceptions.auth import AuthFailure
+from requests.exceptions import SSLError, Timeout, ConnectionError
+
+from ..common.concurrency import iter_completed, CAPTURED_EXCEPTIONS
+from ..connection_manager import LhubConfig
+from ..log import generate_logger, ExpectedLoggerTypes
+
+DEFAULT_TIMEOUT = 15
+
+# Column order for health check results
+HEALTH_CHECK_HEADERS = ["connection name", "hostname", "auth type", "status", "ssl", "login seconds", "version", "error"]
+
+
+def _describe_failure(err: BaseException):
+    if isinstance(err, SSLError):
+        return "ssl_error"
+    elif isinstance(err, Timeout):
+        return "timeout"
+    elif isinstance(err, ConnectionError):
+        return "unreachable"
+    elif isinstance(err, AuthFailure):
+        return "auth_failed"
+    return "error"
+
+
+def check_connection(config: LhubConfig, instance_name, timeout=None) -> dict:
+    """
+    Log into a single stored connection and report how it went
+
+    :param config: LhubConfig holding the connection
+    :param instance_name: name of the stored connection
+    :param timeout: HTTP timeout in seconds for each request made while checking (default: DEFAULT_TIMEOUT)
+    :return: dict with the columns listed in HEALTH_CHECK_HEADERS
+    """
+    result = {k: None for k in HEALTH_CHECK_HEADERS}
+    result["connection name"] = instance_name
+    try:
+        credentials = config.get_instance(instance_name, safe=False)
+    except CAPTURED_EXCEPTIONS as err:
+        result.update({"status": "config_error", "error": getattr(err, "message", None) or repr(err)})
+        return result
+
+    result.update({
+        "hostname": credentials.hostname,
+        "auth type": credentials.auth_type,
+        "ssl": "verified" if credentials.verify_ssl else "disabled",
+    })
+    start = time.perf_counter()
+    try:
+        session = config.verify_connection(
+            server=credentials.hostname,
+            username=credentials.username,
+            password=credentials.password,
+            api_key=credentials.api_key,
+            verify_ssl=credentials.verify_ssl,
+            timeout=timeout or DEFAULT_TIMEOUT,
+        )
+    except CAPTURED_EXCEPTIONS as err:
+        status = _describe_failure(err)
+        result.update({"status": status, "error": getattr(err, "message", None) or str(err) or repr(err)})
+        if status == "ssl_error":
+            result["ssl"] = "failed"
+    else:
+        result.update({"status": "ok", "version": session.api.version})
+    result["login seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def check_connections(instances: list = None, credentials_file_name=None, timeout=None, max_workers=None, logger: ExpectedLoggerTypes = None) -> list:
+    """
+    Check many stored connections concurrently
+
+    :param instances: names of connections to check (default: all stored connections)
+    :param credentials_file_name: alternate credentials file name
+    :param timeout: per-request HTTP timeout in seconds (default: DEFAULT_TIMEOUT)
+    :param max_workers: maximum number of connections to check at the same time
+    :param logger: optional logger
+    :return: list of result dicts, sorted by connection name
+    """
+    log = logger or generate_logger(name=__name__)
+    config = LhubConfig(credentials_file_name=credentials_file_name, logger=log)
+    instances = instances or config.list_configured_instances()
+    results = []
+    for task in iter_completed(lambda i: check_connection(config, i, timeout=timeout), instances, max_workers=max_workers):
+        results.append(task.result)
+        log.debug(f"Health check finished: {task.item}", status=task.result["status"], seconds=task.result["login seconds"])
+    return sorted(results, key=lambda r: r["connection name"])
@@ -0,0 +1,173 @@
+"""
+Shared HTTP connection pools for every LogicHub session in the process
+
+lhub sends each request through requests.request(), which builds a throwaway Session (and connection pool) per call, so
+every request opens a new TCP connection and repeats the TLS handshake. Once installed, requests to hosts which opted in
+(via install() or HTTPPool.configure_host) are routed through one long-lived requests.Session per host instead, so
+keep-alive connections are reused across requests, threads and LogicHubCLI objects that point at the same server.
+Requests to any other host still go through lhub's own request function, exactly as before.
+"""
+
+import atexit
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import lhub.api
+import requests
+from requests.adapters import HTTPAdapter
+
+from .log import ExpectedLoggerTypes
+
+DEFAULT_POOL_MAXSIZE = 16
+
+
+class _RejectAllCookies(DefaultCookiePolicy):
+    """
+    Keep the shared session's cookie jar empty. lhub passes its own session cookie on every request, and different
+    LogicHub objects (possibly logged in as different users) share a pool, so cookies must never carry over between them.
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+class HTTPPool:
+
+    def __init__(self, logger: ExpectedLoggerTypes = None):
+        self.log = logger
+        self.__lock = threading.Lock()
+        self.__sessions = {}
+        self.__pool_sizes = {}
+
+    @staticmethod
+    def _host_key(url):
+        _parts = urlsplit(url)
+        return f"{_parts.scheme}://{_parts.netloc}".lower()
+
+    def configure_host(self, hostname, pool_maxsize: int = None):
+        """
+        Opt a host in to the shared pool, and set the number of connections to keep open for it
+
+        The pool size only applies if no request has been sent to the host yet.
+        """
+        with self.__lock:
+            for scheme in ("https", "http"):
+                self.__pool_sizes.setdefault(self._host_key(f"{scheme}://{hostname}"), pool_maxsize or DEFAULT_POOL_MAXSIZE)
+
+    def handles(self, url):
+        """Whether requests to this URL's host go through the shared pool"""
+        return self._host_key(url) in self.__pool_sizes
+
+    def session_for(self, url) -> requests.Session:
+        key = self._host_key(url)
+        with self.__lock:
+            if key not in self.__sessions:
+                pool_maxsize = self.__pool_sizes.setdefault(key, DEFAULT_POOL_MAXSIZE)
+                if self.log:
+                    self.log.debug(f"Creating HTTP connection pool", host=key, pool_maxsize=pool_maxsize)
+                session = requests.Session()
+                session.cookies.set_policy(_RejectAllCookies())
+                # A single host per session, so one urllib3 pool is enough; pool_maxsize caps idle connections kept for reuse
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.__sessions[key] = session
+            return self.__sessions[key]
+
+    def request(self, method, url, **kwargs) -> requests.Response:
+        """Drop-in replacement for requests.request"""
+        return self.session_for(url).request(method=method, url=url, **kwargs)
+
+    def stats(self) -> list:
+        """Connections opened versus requests sent for each host (reused = requests sent over an existing connection)"""
+        results = []
+        with self.__lock:
+            sessions = dict(self.__sessions)
+        for host, session in sorted(sessions.items()):
+            opened, sent = self._pool_counts(session.get_adapter(host))
+            reused = max(0, sent - opened) if opened is not None else None
+            results.append({"host": host, "pool_maxsize": self.__pool_sizes.get(host), "connections opened": opened, "requests": sent, "connections reused": reused})
+        return results
+
+    @staticmethod
+    def _pool_counts(adapter: HTTPAdapter):
+        """
+        Connections opened and requests sent through an adapter's urllib3 pools, or (None, None) if they cannot be read
+
+        The counters are only for reporting, so anything unexpected from a different version of requests or urllib3 just
+        leaves them out rather than failing.
+        """
+        pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+        opened = sent = 0
+        try:
+            for pool_key in list(pools.keys()):
+                pool = pools.get(pool_key)
+                opened += getattr(pool, "num_connections", 0)
+                sent += getattr(pool, "num_requests", 0)
+        except (AttributeError, TypeError):
+            return None, None
+        return opened, sent
+
+    def log_stats(self):
+        if self.log:
+            for host_stats in self.stats():
+                self.log.debug(f"HTTP connection pool usage", **{k.replace(" ", "_"): v for k, v in host_stats.items()})
+
+    def close(self):
+        with self.__lock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions = {}
+
+
+_POOL = HTTPPool()
+_INSTALL_LOCK = threading.Lock()
+# The request function which lhub used before install(), for every host which has not opted in
+_ORIGINAL_REQUEST = None
+
+
+def get_pool() -> HTTPPool:
+    return _POOL
+
+
+def _route_request(method, url, **kwargs) -> requests.Response:
+    if _POOL.handles(url):
+        return _POOL.request(method, url, **kwargs)
+    return _ORIGINAL_REQUEST(method=method, url=url, **kwargs)
+
+
+def install(hostname=None, pool_maxsize: int = None, logger: ExpectedLoggerTypes = None):
+    """
+    Route lhub HTTP calls for a host through the shared pools. Safe to call repeatedly.
+
+    lhub has a single module-level request function, so that is where the routing happens, but only hosts which have
+    opted in (here or via HTTPPool.configure_host) are affected.
+
+    :param hostname: optional: host to opt in and configure a pool size for
+    :param pool_maxsize: maximum connections to keep open to the host (default: DEFAULT_POOL_MAXSIZE)
+    :param logger: optional logger for pool creation and usage stats (the first one provided is kept)
+    """
+    if hostname:
+        _POOL.configure_host(hostname, pool_maxsize)
+    global _ORIGINAL_REQUEST
+    with _INSTALL_LOCK:
+        _POOL.log = _POOL.log or logger
+        if lhub.api.request is not _route_request:
+            _ORIGINAL_REQUEST = lhub.api.request
+            lhub.api.request = _route_request
+            atexit.register(_POOL.log_stats)
+
+
+def uninstall():
+    with _INSTALL_LOCK:
+        if lhub.api.request is _route_request:
+            lhub.api.request = _ORIGINAL_REQUEST
+        atexit.unregister(_POOL.log_stats)
+
+
+def stats() -> list:
+    return _POOL.stats()
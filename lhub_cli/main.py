@@ -1,15 +1,24 @@
-from typing import List
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Union
 
+import atexit
+from contextlib import contextmanager
+import threading
+import time
 import lhub
 from .connection_manager import LogicHubConnection
 from .actions import Actions
+from .async_actions import AsyncActions
+from . import http_pool
+from .common.concurrency import iter_completed, CAPTURED_EXCEPTIONS
+from .exceptions.app import ConnectionNotFound
 from .log import generate_logger, ExpectedLoggerTypes
-import asyncio
+from .session_cache import SessionCache
 
 
 class LogicHubCLI:
 
-    def __init__(self, instance_name, log_level=None, logger: ExpectedLoggerTypes = None, **kwargs):
+    def __init__(self, instance_name, log_level=None, logger: ExpectedLoggerTypes = None, reuse_session: bool = True, **kwargs):
         # ToDo:
         #  * Move the logging function out of lhub and into lhub_cli
         #  * Standardize better w/ the "logging" package
@@ -21,20 +30,111 @@ class LogicHubCLI:
         self.log.debug(f"Initializing config")
         self.__config = LogicHubConnection(instance_alias=instance_name, credentials_file_name=credentials_file_name)
         self.log = self.log.new(hostname=self.hostname)
-        self.log.debug(f"Initializing connection")
-        self.session = lhub.LogicHub(
-            **self.__config.credentials.to_dict(),
-            api_key=self.__config.credentials.api_key,
-            password=self.__config.credentials.password,
-            logger=self.log,
-            **kwargs
-        )
+        self.performance = self.__config.performance
+        self.login_timeout = int(kwargs.pop("login_timeout", None) or self.performance.login_timeout)
+        kwargs.setdefault("default_timeout", self.performance.http_timeout)
+        kwargs.setdefault("cache_seconds", self.performance.cache_seconds)
+
+        if self.performance.pool_maxsize > 0:
+            http_pool.install(hostname=self.hostname, pool_maxsize=self.performance.pool_maxsize, logger=self.log)
+
+        self.reuse_session = reuse_session is True and self.performance.session_ttl > 0
+        self.__session_cache = None
+        self.__saved_cookie = None
+        self.__server_version = None
+        if self.reuse_session:
+            self.__session_cache = SessionCache(
+                encryption=self.__config.config.encryption,
+                credentials_file_name=self.__config.config.credentials_file_name,
+                ttl=self.performance.session_ttl,
+                agent=self.__config.config.agent,
+                logger=self.log
+            )
+        self.session = self.__connect(**kwargs)
         self.actions = Actions(
             session=self.session,
             config=self.__config,
             instance_label=self.__config.instance,
             logger=self.log
         )
+        self.__async_actions = None
+
+    def __new_session(self, verify_api_auth=True, **kwargs):
+        # Building the session only looks up the server version, which never logs in. The first login happens when
+        # auth is verified, so the login timeout is applied in between. (lhub has no constructor option for it.)
+        session = lhub.LogicHub(
+            **self.__config.credentials.to_dict(),
+            api_key=self.__config.credentials.api_key,
+            password=self.__config.credentials.password,
+            logger=self.log,
+            verify_api_auth=False,
+            **kwargs
+        )
+        if hasattr(session.api, "_http_timeout_login"):
+            session.api._http_timeout_login = min(self.login_timeout, session.api.http_timeout_default)
+        else:
+            self.log.debug("This version of lhub does not support a login timeout; using its default")
+        if verify_api_auth:
+            _ = session.api.me()
+        return session
+
+    def __connect(self, **kwargs) -> lhub.LogicHub:
+        if not self.reuse_session:
+            self.log.debug(f"Initializing connection")
+            return self.__new_session(**kwargs)
+
+        saved = self.__session_cache.load(self.__config.credentials)
+        if saved and saved.get("server_version"):
+            # Skip the version lookup and auth check entirely. If the saved cookie has expired, lhub logs in again
+            # automatically on the first 401, and the new cookie is saved at exit.
+            self.log.debug(f"Reusing saved session")
+            session = self.__new_session(init_version=saved["server_version"], verify_api_auth=False, **kwargs)
+            if saved.get("session_cookie"):
+                session.api.session_cookie = saved["session_cookie"]
+            self.__saved_cookie = saved.get("session_cookie")
+            self.__server_version = saved["server_version"]
+        else:
+            self.log.debug(f"Initializing connection")
+            session = self.__new_session(**kwargs)
+            self.__server_version = session.api.version
+            self.__save_session(session)
+
+        # lhub logs out at exit (and registers that again after every login), which would invalidate the saved session
+        atexit.unregister(session.api.close)
+        session.api.close = lambda: None
+        atexit.register(self.__save_session_if_changed, session)
+        return session
+
+    def __save_session(self, session: lhub.LogicHub):
+        self.__saved_cookie = SessionCache.session_cookie(session)
+        self.__session_cache.save(self.__config.credentials, session_cookie=self.__saved_cookie, server_version=self.__server_version)
+
+    def __save_session_if_changed(self, session: lhub.LogicHub):
+        if SessionCache.session_cookie(session) != self.__saved_cookie:
+            self.__save_session(session)
+
+    def close(self):
+        """Release this session. Reusable sessions are saved for later runs; anything else is logged out."""
+        if self.__async_actions is not None:
+            self.__async_actions.close()
+        if self.reuse_session:
+            self.__save_session_if_changed(self.session)
+            atexit.unregister(self.__save_session_if_changed)
+        elif self.session.api.auth_type == 'password':
+            atexit.unregister(self.session.api.close)
+            self.session.api.close()
+
+    def forget_session(self):
+        """Delete this connection's saved session so that the next run logs in from scratch"""
+        if self.__session_cache:
+            self.__session_cache.delete(self.__config.credentials)
+
+    @property
+    def async_actions(self) -> AsyncActions:
+        """Awaitable versions of self.actions, for running many calls against this instance at once from asyncio code"""
+        if self.__async_actions is None:
+            self.__async_actions = AsyncActions(actions=self.actions, session=self.session, logger=self.log)
+        return self.__async_actions
 
     @property
     def hostname(self):
@@ -45,32 +145,217 @@ class LogicHubCLI:
         return self.__config.credentials.auth_type
 
 
+@dataclass
+class FanOutResult:
+    connection_name: str
+    hostname: str = None
+    result: Any = None
+    error: BaseException = None
+    elapsed: float = None
+
+    @property
+    def successful(self):
+        return self.error is None
+
+
 class LogicHubBulkCLI:
-    sessions: List[LogicHubCLI] = None
+    failures: Dict[str, BaseException] = None
+
+    def __init__(
+            self, credentials_file_name: str = None, instances: list = None, log_progress=False, *args,
+            max_workers: int = None, timeout: int = None, lazy: bool = False, idle_timeout: float = None, **kwargs):
+        """
+        Work with many instances at once
 
-    def __init__(self, credentials_file_name: str = None, instances: list = None, log_progress=False, *args, **kwargs):
+        :param credentials_file_name: alternate credentials file name
+        :param instances: names of the connections to use (default: all stored connections)
+        :param log_progress: log each connection as it is established
+        :param max_workers: maximum number of instances to connect to at the same time (default: max_workers from preferences)
+        :param timeout: HTTP timeout in seconds for each request made while connecting to an instance
+        :param lazy: connect to each instance only when it is first used, instead of connecting to all of them up front
+        :param idle_timeout: optional: close sessions which have not been used for this many seconds (checked whenever a session is requested)
+        """
         self.log_progress = log_progress is True
         self.credentials_file_name = credentials_file_name
         __config = LogicHubConnection(credentials_file_name=credentials_file_name)
-        log = __config.log
-        self.instances = instances
-        if not self.instances:
-            self.instances = __config.all_instances
+        self.log = __config.log
+        self.max_workers = max_workers or __config.performance.max_workers
+        self.lazy = lazy is True
+        self.idle_timeout = idle_timeout
+        # Sorted copy, so that the caller's list is left alone
+        self.instances = sorted(instances or __config.all_instances)
+        self.failures = {}
+        self.__sessions: Dict[str, LogicHubCLI] = {}
+        self.__last_used: Dict[str, float] = {}
+        # Number of actions currently running against each session; sessions in use are never closed as idle
+        self.__in_use: Dict[str, int] = {}
+        self.__locks = {i: threading.Lock() for i in self.instances}
+        # Never prompt to create missing connections from worker threads; just report them
+        for _instance in [i for i in self.instances if not __config.exists(i)]:
+            self.log.error(f"No connection found: {_instance}")
+            self.failures[_instance] = ConnectionNotFound(_instance)
+        if timeout:
+            kwargs["default_timeout"] = timeout
+        self.__connection_args, self.__connection_kwargs = args, kwargs
 
-        self.instances.sort()
-        if self.log_progress:
-            log.info(f"Pre-connecting to all instances: {', '.join(self.instances)}")
+        if not self.lazy:
+            if self.log_progress:
+                self.log.info(f"Pre-connecting to all instances: {', '.join(self.instances)}")
+            _ = self.connect_to_multiple(*args, **kwargs)
 
-        self.sessions = asyncio.run(self.connect_to_multiple(*args, **kwargs))
+    @property
+    def sessions(self) -> List[LogicHubCLI]:
+        """Sessions for every instance that could be connected, in sorted order. In lazy mode, this connects to all remaining instances."""
+        if self.lazy:
+            _ = self.connect_to_multiple(*self.__connection_args, **self.__connection_kwargs)
+        return [self.__sessions[i] for i in self.instances if i in self.__sessions]
+
+    @property
+    def connected_instances(self) -> List[str]:
+        return [i for i in self.instances if i in self.__sessions]
 
-    async def connect_to_instance(self, instance_alias, *args, **kwargs):
+    def __getitem__(self, instance_name) -> LogicHubCLI:
+        return self.get_session(instance_name)
+
+    def connect_to_instance(self, instance_alias, *args, **kwargs):
         _session = LogicHubCLI(instance_name=instance_alias, credentials_file_name=self.credentials_file_name, *args, **kwargs)
         if self.log_progress:
             _session.log.info(f"Connected to {_session.instance_name} ({_session.hostname})")
         return _session
 
-    async def connect_to_multiple(self, *args, **kwargs):
-        return await asyncio.gather(*[self.connect_to_instance(i, *args, **kwargs) for i in self.instances])
+    def get_session(self, instance_name) -> LogicHubCLI:
+        """Return the session for an instance, connecting to it first if needed. Raises the original error if the instance failed to connect."""
+        return self.__get_session(instance_name)
+
+    @contextmanager
+    def use_session(self, instance_name) -> Iterator[LogicHubCLI]:
+        """
+        Same as get_session, but marks the session as in use until the block exits, so that close_idle_sessions never
+        closes it partway through a long-running action
+
+        Example:
+            with bulk.use_session("my_instance") as cli:
+                cli.actions.export_playbooks("_exports")
+        """
+        cli = self.__get_session(instance_name, mark_in_use=True)
+        try:
+            yield cli
+        finally:
+            with self.__locks[instance_name]:
+                self.__in_use[instance_name] -= 1
+                self.__last_used[instance_name] = time.time()
+
+    def __get_session(self, instance_name, mark_in_use=False) -> LogicHubCLI:
+        if instance_name not in self.__locks:
+            raise ConnectionNotFound(instance_name)
+        if self.idle_timeout:
+            self.close_idle_sessions(exclude=[instance_name])
+        with self.__locks[instance_name]:
+            if instance_name in self.failures:
+                raise self.failures[instance_name]
+            if instance_name not in self.__sessions:
+                try:
+                    self.__sessions[instance_name] = self.connect_to_instance(instance_name, *self.__connection_args, **self.__connection_kwargs)
+                except CAPTURED_EXCEPTIONS as err:
+                    self.failures[instance_name] = err
+                    self.log.error(f"Failed to connect to {instance_name}: {getattr(err, 'message', None) or repr(err)}")
+                    raise
+            self.__last_used[instance_name] = time.time()
+            if mark_in_use:
+                self.__in_use[instance_name] = self.__in_use.get(instance_name, 0) + 1
+            return self.__sessions[instance_name]
+
+    def close_session(self, instance_name, idle_cutoff: float = None):
+        """
+        Close an instance's session; it reconnects on next use
+
+        :param instance_name: connection name
+        :param idle_cutoff: optional: only close the session if it is not in use and was last used before this time (epoch seconds)
+        """
+        with self.__locks[instance_name]:
+            if idle_cutoff is not None and (self.__in_use.get(instance_name) or self.__last_used.get(instance_name, idle_cutoff) >= idle_cutoff):
+                return
+            cli = self.__sessions.pop(instance_name, None)
+            self.__last_used.pop(instance_name, None)
+        if cli:
+            self.log.debug(f"Closing session: {instance_name}")
+            cli.close()
+
+    def close_idle_sessions(self, idle_timeout: float = None, exclude: list = None):
+        """
+        Close sessions which have not been used for idle_timeout seconds (default: self.idle_timeout). They reconnect on
+        next use. Sessions held through use_session (including every fan_out action) are never closed while in use.
+        """
+        idle_timeout = idle_timeout or self.idle_timeout
+        if not idle_timeout:
+            return
+        cutoff = time.time() - idle_timeout
+        for instance_name, last_used in list(self.__last_used.items()):
+            if last_used < cutoff and instance_name not in (exclude or []):
+                # Checked again under the instance's lock, in case it was picked up in the meantime
+                self.close_session(instance_name, idle_cutoff=cutoff)
+
+    def close(self):
+        for instance_name in self.connected_instances:
+            self.close_session(instance_name)
+
+    def connect_to_multiple(self, *args, **kwargs) -> List[LogicHubCLI]:
+        """Connect to all instances concurrently. Instances that fail are recorded in self.failures rather than raising."""
+        # Arguments are accepted for backward compatibility; they replace whatever was passed to the constructor
+        if args or kwargs:
+            self.__connection_args, self.__connection_kwargs = args, kwargs
+        _pending = [i for i in self.instances if i not in self.failures and i not in self.__sessions]
+        for _ in iter_completed(self.get_session, _pending, max_workers=self.max_workers):
+            # Failures have already been logged and recorded by get_session
+            pass
+        # Keep the same (sorted) order as self.instances regardless of which connections finished first
+        return [self.__sessions[i] for i in self.instances if i in self.__sessions]
+
+    def fan_out(self, method: Union[str, Callable], *args, max_workers: int = None, **kwargs) -> Iterator[FanOutResult]:
+        """
+        Run the same action against every instance concurrently, yielding each result as soon as that instance finishes
+
+        In lazy mode, each instance is connected within the same task that runs the action, so slow logins on one
+        instance never hold up results from the others.
+
+        :param method: name of an Actions method (e.g. "list_users"), or a callable which accepts a LogicHubCLI as its first argument
+        :param args: positional arguments for the method
+        :param max_workers: maximum number of instances to run against at the same time (default: self.max_workers)
+        :param kwargs: keyword arguments for the method
+        """
+        def run(instance_name):
+            with self.use_session(instance_name) as cli:
+                if isinstance(method, str):
+                    return cli, getattr(cli.actions, method)(*args, **kwargs)
+                return cli, method(cli, *args, **kwargs)
+
+        _instances = [i for i in self.instances if i not in self.failures]
+        for task in iter_completed(run, _instances, max_workers=max_workers or self.max_workers):
+            if task.successful:
+                cli, result = task.result
+                yield FanOutResult(connection_name=cli.instance_name, hostname=cli.hostname, result=result, elapsed=task.elapsed)
+                continue
+            cli = self.__sessions.get(task.item)
+            if cli:
+                # Connection failures are logged by get_session, so only log failures of the action itself here
+                cli.log.error(f"Failed on {task.item}: {getattr(task.error, 'message', None) or repr(task.error)}")
+            yield FanOutResult(connection_name=task.item, hostname=cli.hostname if cli else None, error=task.error, elapsed=task.elapsed)
+
+    def map(self, method: Union[str, Callable], *args, **kwargs) -> Tuple[list, Dict[str, BaseException]]:
+        """
+        Run fan_out and merge the results, for methods which return a list per instance (such as list_users)
+
+        :return: tuple of (combined results, dict of errors keyed by connection name)
+        """
+        combined, failures = [], {}
+        for fan_out_result in self.fan_out(method, *args, **kwargs):
+            if not fan_out_result.successful:
+                failures[fan_out_result.connection_name] = fan_out_result.error
+            elif isinstance(fan_out_result.result, list):
+                combined.extend(fan_out_result.result)
+            elif fan_out_result.result is not None:
+                combined.append(fan_out_result.result)
+        return combined, failures
 
 
 def list_all_instances(credentials_file_name=None):
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import lhub
+
+from .agent import AgentClient
+from .connection_manager import Connection
+from .encryption import EnvelopeEncryption
+from .exceptions.encryption import EncryptionKeyError
+from .log import generate_logger, ExpectedLoggerTypes
+from .statics import LHUB_CONFIG_PATH, SESSIONS_FOLDER_NAME, SESSION_CACHE_DEFAULT_TTL
+
+_SESSION_FILE_VERSION = 1
+
+
+def _fingerprint(connection: Connection):
+    # Any change to the stored connection (new password, new token, different server) invalidates a saved session
+    _parts = [connection.hostname, connection.username, connection.password, connection.api_key, str(connection.verify_ssl)]
+    return hashlib.sha256("\0".join(p or "" for p in _parts).encode()).hexdigest()
+
+
+class SessionCache:
+    """
+    Save authenticated session details (session cookie and server version) per connection, so that later script runs
+    can skip logging in. Everything is stored encrypted with the same keys as the credentials file.
+
+    When the credential agent is running, decrypted sessions are also held by the agent, so that loading a saved
+    session does not need the RSA private key any more than loading the credentials does.
+    """
+
+    def __init__(self, encryption: EnvelopeEncryption, credentials_file_name, ttl=None, agent: AgentClient = None, logger: ExpectedLoggerTypes = None):
+        self.__log = logger or generate_logger(name=__name__)
+        self.encryption = encryption
+        self.agent = agent
+        self.ttl = SESSION_CACHE_DEFAULT_TTL if ttl is None else float(ttl)
+        self.folder = os.path.join(LHUB_CONFIG_PATH, SESSIONS_FOLDER_NAME, credentials_file_name)
+
+    def _path(self, connection: Connection):
+        file_name = re.sub(r'[^\w\-.]', '_', connection.connection_name)
+        return os.path.join(self.folder, f"{file_name}.json")
+
+    @staticmethod
+    def _file_version(path):
+        # Every save replaces the file, so the inode changes even when two saves land within the same mtime tick
+        _stat = os.stat(path)
+        return f"{_stat.st_mtime_ns}-{_stat.st_ino}"
+
+    def load(self, connection: Connection):
+        """Return saved session details for a connection, or None if there are none that are still usable"""
+        path = self._path(connection)
+        if self.ttl <= 0 or not os.path.exists(path):
+            return None
+        try:
+            file_version = self._file_version(path)
+            details = self.agent.get_session(path, file_version) if self.agent else None
+            if details:
+                self.__log.debug("Saved session provided by agent")
+            else:
+                details = self.__read(path)
+                if self.agent:
+                    self.agent.put_session(path, file_version, details)
+        except (OSError, ValueError, KeyError, EncryptionKeyError) as err:
+            self.__log.debug(f"Ignoring unreadable saved session: {err!r}")
+            self.delete(connection)
+            return None
+        if details.get("fingerprint") != _fingerprint(connection):
+            self.__log.debug("Saved session does not match the current connection details")
+            self.delete(connection)
+            return None
+        if time.time() - details.get("saved_at", 0) > self.ttl:
+            self.__log.debug("Saved session has expired")
+            self.delete(connection)
+            return None
+        return details
+
+    def __read(self, path):
+        with open(path) as _file:
+            _wrapper = json.load(_file)
+        if _wrapper.get("version") != _SESSION_FILE_VERSION:
+            raise ValueError(f"Unsupported session file version: {_wrapper.get('version')}")
+        return json.loads(self.encryption.decrypt_string(_wrapper["data"]))
+
+    def save(self, connection: Connection, session_cookie=None, server_version=None):
+        details = {
+            "fingerprint": _fingerprint(connection),
+            "session_cookie": session_cookie,
+            "server_version": server_version,
+            "saved_at": time.time(),
+        }
+        os.makedirs(self.folder, mode=0o700, exist_ok=True)
+        path = self._path(connection)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        _fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(_fd, "w") as _file:
+            json.dump({"version": _SESSION_FILE_VERSION, "data": self.encryption.encrypt_string(json.dumps(details))}, _file)
+        os.replace(temp_path, path)
+        if self.agent:
+            self.agent.put_session(path, self._file_version(path), details)
+        self.__log.debug(f"Session saved for reuse: {connection.connection_name}")
+
+    def delete(self, connection: Connection):
+        path = self._path(connection)
+        if os.path.exists(path):
+            os.remove(path)
+
+    @staticmethod
+    def session_cookie(session: lhub.LogicHub):
+        # The "cookies" property is safe to read for any auth type, and never triggers a login
+        return session.api.cookies.get("PLAY_SESSION")
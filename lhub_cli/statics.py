@@ -5,3 +5,12 @@ import os
 LHUB_CONFIG_PATH = os.path.join(str(Path.home()), ".logichub")
 CREDENTIALS_FILE_NAME = "credentials"
 PREFERENCES_FILE_NAME = "preferences"
+
+# Credential agent (opt-in): scripts only talk to the agent when this environment variable points to its socket
+AGENT_SOCKET_ENV_VAR = "LHUB_CLI_AGENT_SOCK"
+AGENT_SOCKET_FILE_NAME = "agent.sock"
+AGENT_DEFAULT_IDLE_TIMEOUT = 3600
+
+# Persisted (encrypted) authenticated sessions, reused across script runs
+SESSIONS_FOLDER_NAME = "sessions"
+SESSION_CACHE_DEFAULT_TTL = 3600
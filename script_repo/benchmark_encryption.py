@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""
+Compare secret encryption/decryption throughput between the legacy RSA-only format and the envelope format
+"""
+
+import argparse
+import os
+import secrets
+import tempfile
+import time
+
+from lhub_cli.common.args import build_args_and_logger
+from lhub_cli.common.output import print_fancy_lists
+from lhub_cli.common.shell import main_script_wrapper
+from lhub_cli.encryption import Encryption, EnvelopeEncryption
+from lhub_cli.statics import LHUB_CONFIG_PATH
+
+
+def get_args():
+    _parser = argparse.ArgumentParser(description="Benchmark credential encryption formats")
+    _parser.add_argument("-n", "--count", type=int, default=200, help="Number of secrets to encrypt and decrypt (default: 200)")
+    _parser.add_argument("-k", "--key_location", default=LHUB_CONFIG_PATH, help=f"Folder containing the RSA keys to use (default: {LHUB_CONFIG_PATH})")
+
+    final_args, logger = build_args_and_logger(
+        parser=_parser,
+        include_list_output_args=True,
+        include_logging_args=True,
+    )
+    return final_args, logger.log
+
+
+# Must be run outside of main in order for the full effect of verbose logging
+args, log = get_args()
+
+
+def time_operation(func, values):
+    start = time.perf_counter()
+    results = [func(v) for v in values]
+    return results, time.perf_counter() - start
+
+
+def summarize(scheme, operation, count, elapsed):
+    return {
+        "scheme": scheme,
+        "operation": operation,
+        "secrets": count,
+        "total seconds": round(elapsed, 4),
+        "secrets/sec": round(count / elapsed, 1) if elapsed else None,
+    }
+
+
+def main():
+    rsa_encryption = Encryption(args.key_location, logger=log)
+    plain_values = [secrets.token_urlsafe(32) for _ in range(args.count)]
+    results = []
+
+    encrypted, elapsed = time_operation(rsa_encryption.encrypt_string, plain_values)
+    results.append(summarize("legacy (rsa)", "encrypt", args.count, elapsed))
+    decrypted, elapsed = time_operation(rsa_encryption.decrypt_string, encrypted)
+    results.append(summarize("legacy (rsa)", "decrypt", args.count, elapsed))
+    assert decrypted == plain_values
+
+    with tempfile.TemporaryDirectory() as _temp_dir:
+        # Unwrapping the data key is part of the real cost of a fresh process, so it is included in the decrypt timing
+        data_key_path = os.path.join(_temp_dir, ".benchmark.datakey")
+        encrypted, elapsed = time_operation(EnvelopeEncryption(rsa_encryption, data_key_path, logger=log).encrypt_string, plain_values)
+        results.append(summarize("envelope", "encrypt", args.count, elapsed))
+        decrypted, elapsed = time_operation(EnvelopeEncryption(rsa_encryption, data_key_path, logger=log).decrypt_string, encrypted)
+        results.append(summarize("envelope", "decrypt", args.count, elapsed))
+        assert decrypted == plain_values
+
+    print_fancy_lists(
+        results=results,
+        output_type=args.output,
+        table_format=args.table_format,
+        output_file=(args.file or None),
+        file_only=(True if args.file else False)
+    )
+
+
+if __name__ == "__main__":
+    main_script_wrapper(main)
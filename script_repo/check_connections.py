@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import argparse
+
+import lhub_cli
+from lhub_cli.common.output import print_fancy_lists
+from lhub_cli.features.health import check_connections, DEFAULT_TIMEOUT, HEALTH_CHECK_HEADERS
+
+
+def get_args():
+    _parser = argparse.ArgumentParser(description="Check connectivity and authentication for stored LogicHub connections")
+
+    # Required inputs
+    _parser.add_argument("instance_names", nargs="*", help="Names of specific instances from stored config (default: check all)")
+
+    # Optional inputs
+    _parser.add_argument("-w", "--workers", type=int, default=None, help="Number of connections to check at the same time")
+    _parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help=f"HTTP timeout per request, in seconds (default: {DEFAULT_TIMEOUT})")
+
+    # Add standard output arg definitions:
+    #         "-f", "--file" (Also write output to a file)
+    #         "-o", "--output" (Output style, e.g. table, csv, json, json-pretty)
+    #         "-t", "--table_format" (for output style of table, set a specific table style, such as plain, grid, and jira)
+    # Also sets logging automatically
+    final_args, logger = lhub_cli.common.args.build_args_and_logger(
+        parser=_parser,
+        include_credential_file_arg=True,
+        include_list_output_args=True,
+        include_logging_args=True,
+    )
+    return final_args, logger.log
+
+
+# Must be run outside of main in order for the full effect of verbose logging
+args, log = get_args()
+
+
+def main():
+    results = check_connections(
+        instances=args.instance_names,
+        credentials_file_name=args.credentials_file_name,
+        timeout=args.timeout,
+        max_workers=args.workers,
+        logger=log
+    )
+
+    print_fancy_lists(
+        results=results,
+        output_type=args.output,
+        table_format=args.table_format,
+        output_file=(args.file or None),
+        ordered_headers=HEALTH_CHECK_HEADERS,
+
+        # Change to "False" to always print output even if writing to a file
+        file_only=(True if args.file else False)
+    )
+
+
+if __name__ == "__main__":
+    lhub_cli.common.shell.main_script_wrapper(main)
@@ -1,22 +1,28 @@
 #!/usr/bin/env python3
 
 import argparse
-import asyncio
+import sys
 
 import lhub_cli
 from lhub_cli.common.output import print_fancy_lists
 from lhub_cli.common.shell import query_yes_no
 
-target_status = "Resolved"
+DEFAULT_TARGET_STATUS = "Resolved"
 
 
 def get_args():
     _parser = argparse.ArgumentParser(description="Search Cases")
     _parser.add_argument("instance_name", help="Nickname of the instance from stored config")
     _parser.add_argument("-l", "--limit", default=None, type=int, help="Limit the number of results")
+    _parser.add_argument("-i", "--input_file", default=None, help="Close the case IDs listed in this file (one per line) instead of running a query")
+    _parser.add_argument("-s", "--status", default=DEFAULT_TARGET_STATUS, help=f"Status to set (default: {DEFAULT_TARGET_STATUS})")
+    _parser.add_argument("-w", "--workers", default=None, type=int, help="Number of cases to update at the same time (default: max_workers from preferences)")
+    _parser.add_argument("--result_log", default=None, help="Write the result for each case to this CSV file")
+    _parser.add_argument("--dry_run", action="store_true", help="Show what would be updated without changing any cases")
 
     return lhub_cli.common.args.build_args_and_logger(
         parser=_parser,
+        include_credential_file_arg=True,
         include_list_output_args=True
     )
 
@@ -56,13 +62,11 @@ def get_query():
                 break
 
 
-async def close_case(case_id, cli_session: lhub_cli.LogicHubCLI):
-    log.warn("Closing case", case_id=case_id)
-    _ = cli_session.session.api.case_update(case_id, status=target_status)
-
-
-async def close_all_cases(case_ids: list, cli_session: lhub_cli.LogicHubCLI):
-    await asyncio.gather(*[close_case(case_id=case_id, cli_session=cli_session) for case_id in case_ids])
+def read_case_ids(file_name):
+    with open(file_name) as _file:
+        for line in _file:
+            if line.strip():
+                yield line.strip()
 
 
 # Must be run outside of main in order for the full effect of verbose logging
@@ -71,29 +75,40 @@ log = logger.log
 
 
 def main():
-    # Prompt the user for the query to execute
-    query = get_query()
-
     # If the instance name does not already exist as a saved connection, this will assist the user in saving a new one.
-    cli = lhub_cli.LogicHubCLI(instance_name=args.instance_name)
-
-    results = cli.session.actions.search_cases_advanced(query=query, limit=args.limit, includeWorkflow=False)
-    log.info(f"Query complete. Total results: {len(results)}")
-
-    print_fancy_lists(
-        results,
-        output_type=args.output,
-        table_format=args.table_format,
-        ordered_headers=["id", "status", "priority", "issueType", "reporter", "assignee", "title", "createdAt", "modifiedAt"],
-        output_file=args.file,
-        # sort_order=["id"],
-        sort_order=[{"name": "createdAt", "reverse": True}],
+    cli = lhub_cli.LogicHubCLI(instance_name=args.instance_name, credentials_file_name=args.credentials_file_name)
+
+    if args.input_file:
+        cases = read_case_ids(args.input_file)
+    else:
+        # Prompt the user for the query to execute
+        query = get_query()
+        results = cli.session.actions.search_cases_advanced(query=query, limit=args.limit, includeWorkflow=False)
+        log.info(f"Query complete. Total results: {len(results)}")
+
+        print_fancy_lists(
+            results,
+            output_type=args.output,
+            table_format=args.table_format,
+            ordered_headers=["id", "status", "priority", "issueType", "reporter", "assignee", "title", "createdAt", "modifiedAt"],
+            output_file=args.file,
+            # sort_order=["id"],
+            sort_order=[{"name": "createdAt", "reverse": True}],
+        )
+
+        if not results or not query_yes_no("\nProceed with closing cases?"):
+            return
+        cases = [r["id"] for r in results]
+
+    summary = cli.actions.bulk_update_cases(
+        cases,
+        changes={"status": args.status},
+        max_workers=args.workers,
+        dry_run=args.dry_run,
+        result_log=args.result_log,
     )
-
-    if not results or not query_yes_no("\nProceed with closing cases?"):
-        return
-    cases = [r["id"] for r in results]
-    asyncio.run(close_all_cases(case_ids=cases, cli_session=cli))
+    if summary["failed"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+"""
+Start or manage the credential agent, which keeps decrypted credentials in memory for other scripts
+
+Usage, similar to ssh-agent:
+    eval "$(./credential_agent.py)"
+"""
+
+import argparse
+import os
+import sys
+
+from lhub_cli.agent import AgentClient, CredentialAgent, DEFAULT_SOCKET_PATH
+from lhub_cli.common.args import build_args_and_logger
+from lhub_cli.common.shell import main_script_wrapper
+from lhub_cli.statics import AGENT_SOCKET_ENV_VAR, AGENT_DEFAULT_IDLE_TIMEOUT
+
+
+def get_args():
+    _parser = argparse.ArgumentParser(description="LogicHub CLI credential agent")
+    _parser.add_argument("-s", "--socket", default=os.environ.get(AGENT_SOCKET_ENV_VAR) or DEFAULT_SOCKET_PATH, help=f"Socket path (default: ${AGENT_SOCKET_ENV_VAR} or {DEFAULT_SOCKET_PATH})")
+    _parser.add_argument("-i", "--idle_timeout", type=int, default=AGENT_DEFAULT_IDLE_TIMEOUT, help=f"Exit and forget all credentials after this many idle seconds (default: {AGENT_DEFAULT_IDLE_TIMEOUT})")
+    _parser.add_argument("-F", "--foreground", action="store_true", help="Run in the foreground instead of as a background daemon")
+
+    mgmt = _parser.add_mutually_exclusive_group()
+    mgmt.add_argument("-k", "--kill", action="store_true", help="Stop a running agent")
+    mgmt.add_argument("--status", action="store_true", help="Show the status of a running agent")
+    mgmt.add_argument("--clear", action="store_true", help="Forget all credentials held by a running agent")
+
+    final_args, logger = build_args_and_logger(
+        parser=_parser,
+        include_logging_args=True,
+        default_log_level="WARNING",
+    )
+    return final_args, logger.log
+
+
+# Must be run outside of main in order for the full effect of verbose logging
+args, log = get_args()
+
+
+def daemonize():
+    # Classic double fork so that the agent is fully detached from the calling shell
+    if os.fork() > 0:
+        return False
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+    with open(os.devnull, "r+") as _null:
+        for _stream in (sys.stdin, sys.stdout, sys.stderr):
+            os.dup2(_null.fileno(), _stream.fileno())
+    return True
+
+
+def main():
+    client = AgentClient(args.socket, logger=log)
+    if args.kill:
+        client.stop()
+        print(f"unset {AGENT_SOCKET_ENV_VAR};")
+        return
+    if args.status:
+        print(client.status())
+        return
+    if args.clear:
+        client.clear()
+        return
+
+    if client.ping():
+        log.warning(f"An agent is already running on {args.socket}")
+        print(f"{AGENT_SOCKET_ENV_VAR}={args.socket}; export {AGENT_SOCKET_ENV_VAR};")
+        return
+
+    agent = CredentialAgent(socket_path=args.socket, idle_timeout=args.idle_timeout, logger=log)
+    print(f"{AGENT_SOCKET_ENV_VAR}={args.socket}; export {AGENT_SOCKET_ENV_VAR};")
+    sys.stdout.flush()
+    if args.foreground or daemonize():
+        agent.serve()
+
+
+if __name__ == "__main__":
+    main_script_wrapper(main)
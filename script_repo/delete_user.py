@@ -28,7 +28,8 @@ async def delete_user_from_instance(username, cli_session: lhub_cli.LogicHubCLI)
 
     try:
         new_log.info(f"Deleting user")
-        result = cli_session.actions.delete_user_by_name(username=username)
+        # Runs on the instance's executor (so the event loop is never blocked), behind its shared rate limit
+        result = await cli_session.async_actions.delete_user_by_name(username=username)
         new_log.debug(f"Result: {json.dumps(result)}")
         return {**deletion_result_defaults, **{"user": username, "instance": cli_session.instance_name, "result": "successful"}}
     except lhub.exceptions.app.UserNotFound:
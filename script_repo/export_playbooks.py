@@ -14,6 +14,12 @@ def get_args():
 
     # Optional args:
     _parser.add_argument("-l", "--limit", type=int, default=DEFAULT_EXPORT_LIMIT, help=f"Optional: limit the number of playbooks to export (default: {DEFAULT_EXPORT_LIMIT or 'None'})")
+    _parser.add_argument("-w", "--workers", type=int, default=None, help="Optional: maximum number of playbooks to download at the same time (default: max_workers from preferences)")
+    _parser.add_argument("-p", "--pretty", action="store_true", help="Optional: reformat JSON exports with indentation for readability")
+    _parser.add_argument("-i", "--incremental", action="store_true", help="Optional: only download playbooks which are new or changed since the last export in the same destination, and report what changed")
+    _parser.add_argument("-s", "--store", action="store_true", help="Optional: treat the destination as a content-addressed store shared by all instances and runs, so identical playbooks are only stored once (see gc_export_store.py)")
+    _parser.add_argument("-r", "--run_name", type=str, default=None, help="Optional: with --store, the run to record this export under (default: today's date)")
+    _parser.add_argument("-a", "--archive", choices=list(lhub_cli.features.exports.ARCHIVE_FORMATS), default=None, help="Optional: stream every export into a single compressed tar file (with a manifest.json) instead of individual files")
     _parser.add_argument("-d", "--destination", type=str, default=None, help="Optional: specify the path for exports (default: new \"_exports\" folder in the current working directory")
 
     final_parser, logger = lhub_cli.common.args.build_args_and_logger(
@@ -40,7 +46,9 @@ def main():
     )
     successful, failures = session.actions.export_playbooks(
         args.destination if args.destination else EXPORT_FOLDER,
-        limit=args.limit, return_summary=True
+        limit=args.limit, return_summary=True, max_workers=args.workers, pretty=args.pretty,
+        incremental=args.incremental, content_store=args.store, run_name=args.run_name,
+        archive=args.archive
     )
     if not successful:
         failed_str = "One or more playbooks failed to export:\n\n"
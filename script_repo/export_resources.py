@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import sys
+
+import lhub_cli
+import argparse
+
+from lhub_cli.features.exporters import EXPORTERS
+
+EXPORT_FOLDER = "_exports"
+DEFAULT_EXPORT_LIMIT = 0
+
+
+def get_args():
+    _parser = argparse.ArgumentParser(description="Export resources of every type (or only the types given) from a LogicHub server in one parallel job")
+    _parser.add_argument("instance_name", help="Nickname of the instance from stored config")
+    _parser.add_argument("resource_types", nargs="*", metavar="resource_type", help=f"Optional: resource types to export (default: all). Available types: {', '.join(f'{t} (metadata only)' if e.metadata_only else t for t, e in EXPORTERS.items())}. Metadata only types are exported as their list entries, which cannot be used to restore them")
+
+    # Optional args:
+    _parser.add_argument("-l", "--limit", type=int, default=DEFAULT_EXPORT_LIMIT, help=f"Optional: limit the number of resources to export of each type (default: {DEFAULT_EXPORT_LIMIT or 'None'})")
+    _parser.add_argument("-w", "--workers", type=int, default=None, help="Optional: maximum number of resources to download at the same time (default: max_workers from preferences)")
+    _parser.add_argument("-p", "--pretty", action="store_true", help="Optional: reformat JSON exports with indentation for readability")
+    _parser.add_argument("-i", "--incremental", action="store_true", help="Optional: only download resources which are new or changed since the last export in the same destination, and report what changed")
+    _parser.add_argument("-s", "--store", action="store_true", help="Optional: treat the destination as a content-addressed store shared by all instances and runs, so identical resources are only stored once (see gc_export_store.py)")
+    _parser.add_argument("-r", "--run_name", type=str, default=None, help="Optional: with --store, the run to record this export under (default: today's date)")
+    _parser.add_argument("-a", "--archive", choices=list(lhub_cli.features.exports.ARCHIVE_FORMATS), default=None, help="Optional: stream every export into a single compressed tar file (with a manifest.json) instead of individual files")
+    _parser.add_argument("-d", "--destination", type=str, default=None, help="Optional: specify the path for exports (default: new \"_exports\" folder in the current working directory")
+
+    final_parser, logger = lhub_cli.common.args.build_args_and_logger(
+        parser=_parser,
+        include_credential_file_arg=True,
+        include_logging_args=True,
+        default_log_level="INFO"
+    )
+
+    if not final_parser.limit:
+        final_parser.limit = None
+    return final_parser, logger.log
+
+
+# Must be run outside of main in order for the full effect of verbose logging
+args, log = get_args()
+
+
+def main():
+    session = lhub_cli.LogicHubCLI(
+        credentials_file_name=args.credentials_file_name,
+        instance_name=args.instance_name
+    )
+    failures = session.actions.export_resources(
+        args.destination if args.destination else EXPORT_FOLDER,
+        resource_types=args.resource_types or None, limit=args.limit, max_workers=args.workers, pretty=args.pretty,
+        incremental=args.incremental, content_store=args.store, run_name=args.run_name,
+        archive=args.archive
+    )
+    if any(failures.values()):
+        failed_str = "One or more resources failed to export:\n\n"
+        for resource_type, failed in failures.items():
+            for k, v in failed.items():
+                failed_str += f"\t{resource_type} {k}: {v['name']}\n"
+                _error = v["errors"][0].replace('\n', '\n\t\t')
+                failed_str += f"\t\t{_error}\n\n"
+        print(failed_str.rstrip() + '\n', file=sys.stderr)
+
+
+if __name__ == "__main__":
+    lhub_cli.common.shell.main_script_wrapper(main)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Remove old runs from a content-addressed export store (export_playbooks.py --store), along with any stored exports
+which no remaining run refers to
+"""
+
+import argparse
+
+from lhub_cli.common.args import build_args_and_logger
+from lhub_cli.common.output import print_fancy_lists
+from lhub_cli.common.shell import main_script_wrapper
+from lhub_cli.features.exports import ContentStore
+
+
+def get_args():
+    _parser = argparse.ArgumentParser(description="Garbage-collect a content-addressed export store")
+    _parser.add_argument("store", help="Root folder of the export store")
+
+    # Optional args:
+    _parser.add_argument("-k", "--keep_runs", type=int, default=None, help="Optional: keep only this many of the newest runs")
+    _parser.add_argument("-a", "--older_than_days", type=float, default=None, help="Optional: remove runs last written more than this many days ago")
+    _parser.add_argument("-g", "--grace_hours", type=float, default=24, help="Optional: never remove stored exports written or reused within this many hours, so exports still in progress are safe (default: 24)")
+    _parser.add_argument("--dry_run", action="store_true", help="Optional: only report what would be removed")
+
+    final_args, logger = build_args_and_logger(
+        parser=_parser,
+        include_list_output_args=True,
+        include_logging_args=True,
+        default_log_level="INFO"
+    )
+    return final_args, logger.log
+
+
+# Must be run outside of main in order for the full effect of verbose logging
+args, log = get_args()
+
+
+def main():
+    store = ContentStore(args.store)
+    runs = store.list_runs()
+    log.info(f"{len(runs)} runs found", store=args.store)
+    stats = store.gc(keep_runs=args.keep_runs, older_than_days=args.older_than_days, grace_seconds=args.grace_hours * 3600, dry_run=args.dry_run)
+    if args.dry_run:
+        log.info("Dry run; nothing was removed")
+    print_fancy_lists(
+        results=[stats],
+        output_type=args.output,
+        table_format=args.table_format,
+        output_file=(args.file or None),
+        file_only=(True if args.file else False)
+    )
+
+
+if __name__ == "__main__":
+    main_script_wrapper(main)
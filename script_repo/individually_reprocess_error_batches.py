@@ -11,11 +11,14 @@ from math import floor
 from datetime import datetime
 
 from lhub import LogicHub
-from requests.exceptions import ConnectTimeout, RequestException
 
 from lhub_cli.common.args import build_args_and_logger
+from lhub_cli.common.concurrency import CAPTURED_EXCEPTIONS
+from lhub_cli.common.rate_limit import get_rate_limiter
+from lhub_cli.common.retry import get_retry_policy
 from lhub_cli.common.shell import main_script_wrapper
-from lhub_cli.connection_manager import LogicHubConnection
+from lhub_cli.connection_manager import LogicHubConnection, get_performance_preferences
+from lhub_cli.exceptions.app import CircuitOpen
 
 # Static/configurable vars
 DEFAULT_LOG_LEVEL = "WARNING"
@@ -44,7 +47,7 @@ def get_args():
 
     # Optional args:
     _parser.add_argument("-l", "--limit", metavar="INT", type=int, default=None, help=f"Set the maximum number of batches to reprocess (default: None)")
-    _parser.add_argument("-r", "--retry", action="store_true", help=f"Retry automatically if script fails (e.g. loses connectivity, etc.)")
+    _parser.add_argument("-r", "--retry", action="store_true", help=f"Retry a batch automatically if it fails to start (e.g. loses connectivity, etc.), and move on to the next batch if it still fails")
 
     final_args, logger = build_args_and_logger(
         parser=_parser,
@@ -67,8 +70,9 @@ class Batches:
 
 class LogicHubStream:
     VERIFY_SSL = True
-    HTTP_TIMEOUT = 30
-    TIME_BETWEEN_STATUS_CHECKS = 5
+    # Defaults for http_timeout and poll_interval come from the [performance] section of the preferences file
+    HTTP_TIMEOUT = None
+    TIME_BETWEEN_STATUS_CHECKS = None
     _initial_batches = None
     __last_batch_check = None
     batches = None
@@ -76,8 +80,18 @@ class LogicHubStream:
 
     def __init__(self, stream_id, **kwargs):
         self.stream_id = re.sub(r'\D+', '', stream_id) if isinstance(stream_id, str) else stream_id
+        performance = get_performance_preferences(kwargs.pop("connection_name", None))
+        self.HTTP_TIMEOUT = self.HTTP_TIMEOUT or performance.http_timeout
+        self.TIME_BETWEEN_STATUS_CHECKS = self.TIME_BETWEEN_STATUS_CHECKS or performance.poll_interval
+        # Share the same per-instance limits as lhub_cli's own bulk actions, so parallel jobs do not flood the server
+        self.rate_limiter = get_rate_limiter(kwargs["hostname"], performance.rate_limit, performance.rate_burst)
+        self.reprocess_limiter = get_rate_limiter(
+            (kwargs["hostname"], "reprocess_batches"),
+            rate=1 / performance.seconds_between_calls if performance.seconds_between_calls else 0,
+            burst=1
+        )
         log.debug("Initializing LogicHub session")
-        self.session = LogicHub(**kwargs)
+        self.session = LogicHub(default_timeout=self.HTTP_TIMEOUT, **kwargs)
         print(f"Checking status of stream \"{self.stream_name}\"")
         print(f"\tURL: {self.session.api.url.stream_by_id.format(self.stream_id)}")
         update_logger(stream=self.stream_name)
@@ -107,6 +121,7 @@ class LogicHubStream:
 
     def update_batches(self):
         time.sleep(self.seconds_to_sleep_before_next_batch_check)
+        self.rate_limiter.acquire()
         _all_batches = self.session.actions.get_batches_by_stream_id(self.stream_id)
         self.__last_batch_check = time.time()
         self.batches = Batches(_all_batches)
@@ -141,6 +156,8 @@ class LogicHubStream:
         if batch_id not in self.error_batches:
             batch_log.warning(f"Batch state changed; no longer in error state")
             return
+        self.reprocess_limiter.acquire()
+        self.rate_limiter.acquire()
         _ = self.session.actions.reprocess_batch(batch_id)
         job_start = time.time()
         batch_state = self.batches.map[f'batch-{batch_id}']['state']
@@ -201,6 +218,7 @@ def main():
     connection = LogicHubConnection(connection_name)
     session = LogicHubStream(
         stream_id=args.stream_id,
+        connection_name=connection.instance,
         api_key=connection.credentials.api_key,
         password=connection.credentials.password,
         **connection.credentials.to_dict()
@@ -220,6 +238,19 @@ def main():
     log.info(f"{initial_error_count} error batches found")
     print(f"{initial_error_count} error batches found")
 
+    # Retries use exponential backoff within a retry budget, and stop altogether (CircuitOpen) if the instance goes down
+    retry_policy = get_retry_policy(connection.credentials.hostname, connection.performance, logger=log)
+
+    attempt_number = 0
+
+    def process_batch_with_refresh(batch_dict):
+        # On a retry, refresh batch states first so that a batch which did start before the failure is not started twice
+        nonlocal attempt_number
+        attempt_number += 1
+        if attempt_number > 1:
+            session.update_batches()
+        session.process_batch(batch_dict)
+
     while error_batches_remaining:
         log.info("Error batches remaining", batch_number=initial_error_count - len(error_batches_remaining) + 1, total_batches=initial_error_count)
         print(f"\n{connection_name}, Stream {args.stream_id}\nBatch {initial_error_count - len(error_batches_remaining) + 1} of {initial_error_count}")
@@ -227,18 +258,14 @@ def main():
         if not args.retry:
             session.process_batch(batch)
         else:
+            attempt_number = 0
             try:
-                session.process_batch(batch)
-            except ConnectTimeout:
-                log.error("Request timed out; reattempting...")
-            except RequestException as e:
-                log.critical(f"Failed with requests exception: {repr(e)}")
-                log.info("Reattempting...")
-            except KeyboardInterrupt as e:
-                raise e
-            except (Exception, BaseException) as e:
-                log.critical(f"Failed with unknown exception: {repr(e)}")
-                log.critical("Reattempting...")
+                retry_policy.call(process_batch_with_refresh, batch)
+            except CircuitOpen:
+                raise
+            except CAPTURED_EXCEPTIONS as e:
+                log.critical(f"Batch failed after {getattr(e, 'attempts', 1)} attempt(s): {repr(e)}")
+                log.critical("Moving on to the next batch...")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+"""
+Generate encryption keys ahead of time, e.g. when provisioning a machine, so that the first real command does not have to wait
+"""
+
+import argparse
+import os
+import time
+
+from lhub_cli.common.args import build_args_and_logger
+from lhub_cli.common.shell import main_script_wrapper
+from lhub_cli.encryption import Encryption
+from lhub_cli.statics import LHUB_CONFIG_PATH
+
+# Safe here because of the __main__ guard at the bottom of this script
+DEFAULT_POOLSIZE = min(os.cpu_count() or 1, 8)
+
+
+def get_args():
+    _parser = argparse.ArgumentParser(description="Generate LogicHub CLI encryption keys")
+    _parser.add_argument("-k", "--key_location", default=LHUB_CONFIG_PATH, help=f"Folder in which to store the keys (default: {LHUB_CONFIG_PATH})")
+    _parser.add_argument("-b", "--key_size", type=int, default=Encryption.default_key_size, help=f"Key size in bits (default: {Encryption.default_key_size})")
+    _parser.add_argument("-p", "--poolsize", type=int, default=DEFAULT_POOLSIZE, help=f"Number of processes to use for prime generation (default: {DEFAULT_POOLSIZE})")
+
+    final_args, logger = build_args_and_logger(
+        parser=_parser,
+        include_logging_args=True,
+        default_log_level="INFO",
+    )
+    return final_args, logger.log
+
+
+def main():
+    args, log = get_args()
+    encryption = Encryption(args.key_location, key_size=args.key_size, poolsize=args.poolsize, logger=log)
+    if encryption.keys_exist:
+        log.warning(f"Encryption keys already exist; nothing to do [{encryption.private_key_path}]")
+        return
+    start = time.time()
+    encryption.generate_keys()
+    print(f"Keys saved to {args.key_location} ({time.time() - start:.1f} seconds)")
+
+
+# Argument parsing happens inside main so that prime generation worker processes can safely re-import this module
+if __name__ == "__main__":
+    main_script_wrapper(main)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import sys
 
 import lhub_cli
 from lhub_cli.common.output import print_fancy_lists
@@ -49,36 +50,34 @@ def main():
     attributes = "*"
 
     combined_results = []
+    failures = {}
     if instances:
-        instance_sessions = {}
-        instance_count = len(instances)
-        cycle = range(instance_count)
-
-        if log_level != "DEBUG":
-            cycle = progressbar.progressbar(cycle)
-            print(f"Verifying connections")
-        for n in cycle:
-            log.debug(f"Verifying connection {n + 1}/{instance_count}")
-            instance_sessions[instances[n]] = lhub_cli.LogicHubCLI(
-                instance_name=instances[n],
-                credentials_file_name=credentials_file_name
-            )
-
-        cycle = range(instance_count)
+        # Each instance is connected and queried in a single task, so slow logins never hold up the other instances
+        bulk = lhub_cli.LogicHubBulkCLI(credentials_file_name=credentials_file_name, instances=instances, lazy=True)
+        failures.update(bulk.failures)
+        progress = None
         if log_level != "DEBUG":
-            cycle = progressbar.progressbar(cycle)
             print(f"Fetching commands")
-        for n in cycle:
-            _instance = instances[n]
-            cli = instance_sessions[instances[n]]
-            log.debug(f"Fetching commands from {cli.instance_name} ({n + 1}/{instance_count})")
-            combined_results.extend(
-                cli.actions.list_commands(
-                    print_output=False,
-                    show_hostname=True,
-                    attributes=attributes,
-                )
-            )
+            progress = progressbar.ProgressBar(max_value=len(instances))
+            progress.update(len(failures))
+        for result in bulk.fan_out(
+            "list_commands",
+            print_output=False,
+            show_hostname=True,
+            attributes=attributes
+        ):
+            if result.successful:
+                log.debug(f"Fetched {len(result.result)} commands from {result.connection_name}")
+                combined_results.extend(result.result)
+            else:
+                failures[result.connection_name] = result.error
+            if progress:
+                progress.update(progress.value + 1)
+        if progress:
+            progress.finish()
+
+        # Instances finish in any order, so put the rows back in a predictable order before printing
+        combined_results = sorted(combined_results, key=lambda r: (r["connection name"], r.get("name") or ""))
 
     print_fancy_lists(
         results=combined_results,
@@ -96,6 +95,12 @@ def main():
         file_only=(True if args.file else False)
     )
 
+    if failures:
+        print(f"\nFailed to fetch commands from {len(failures)} instance(s):", file=sys.stderr)
+        for instance_name in sorted(failures):
+            _error = failures[instance_name]
+            print(f"  {instance_name}: {getattr(_error, 'message', None) or str(_error) or repr(_error)}", file=sys.stderr)
+
 
 if __name__ == "__main__":
     lhub_cli.common.shell.main_script_wrapper(main)
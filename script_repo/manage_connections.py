@@ -7,6 +7,8 @@ from requests.exceptions import SSLError
 
 from lhub_cli.common.shell import query_yes_no, main_script_wrapper
 from lhub_cli.common.args import build_args_and_logger
+from lhub_cli.common.config import read_records_file
+from lhub_cli.common.output import print_fancy_lists
 from lhub_cli.connection_manager import LhubConfig
 
 
@@ -19,6 +21,11 @@ def get_args():
     mgmt.add_argument("instance_label", type=str, nargs="?", help="Label (name) for the connection")
     mgmt.add_argument('-c', '--create', metavar="instance_label", help="Create a new connection")
     mgmt.add_argument('-d', '--delete', metavar="instance_label", help="Delete an existing connection")
+    mgmt.add_argument('-i', '--import', dest="import_file", metavar="FILE", help="Import connections in bulk from a CSV or JSON file (columns: name, hostname, api_key or username and password, verify_ssl)")
+
+    bulk = _parser.add_argument_group("Bulk Import")
+    bulk.add_argument("-w", "--workers", type=int, default=None, help="Optional: number of connections to verify at the same time")
+    bulk.add_argument("--overwrite", action="store_true", help="Optional: replace existing connections with the same name")
 
     connection = _parser.add_argument_group("New Connection Properties")
     connection.add_argument("-s", "--server", nargs='?', type=str, help="Optional: server hostname", default=None)
@@ -73,6 +80,16 @@ def main():
             verify_ssl=args.no is False
         )
 
+    elif args.import_file:
+        report = config.import_connections(
+            read_records_file(args.import_file),
+            max_workers=args.workers,
+            overwrite=args.overwrite
+        )
+        print_fancy_lists(report)
+        if any(r["status"] == "failed" for r in report):
+            sys.exit(1)
+
     elif args.show_all:
         instances = config.list_configured_instances()
         for i in instances:
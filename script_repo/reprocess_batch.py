@@ -11,7 +11,6 @@ from lhub_cli.common.args import build_args_and_logger
 
 # Static/configurable vars
 LOG_LEVEL = "INFO"
-_SECONDS_BETWEEN_CALLS = 0.5
 
 
 def get_args():
@@ -37,6 +36,7 @@ args, log = get_args()
 
 def main():
     cli = LogicHubCLI(args.instance_name, credentials_file_name=args.credentials_file_name)
+    # Delay between calls comes from "seconds_between_calls" in the [performance] section of the preferences file
     cli.actions.reprocess_batches(args.batch_ids)
 
 
@@ -29,8 +29,8 @@ def parse_and_validate_args():
         help="Top level fields to drop")
 
     connection = _parser.add_argument_group('connection')
-    connection.add_argument("-ti", "--timeout", metavar="<sec>", type=int, default=120, help="HTTP request timeout, except for logon (default: 120)")
-    connection.add_argument("-tl", "--timeout_logon", metavar="<sec>", type=int, default=20, help="Logon timeout (default: 20)")
+    connection.add_argument("-ti", "--timeout", metavar="<sec>", type=int, default=None, help="HTTP request timeout, except for logon (default: http_timeout from preferences)")
+    connection.add_argument("-tl", "--timeout_logon", metavar="<sec>", type=int, default=None, help="Logon timeout (default: login_timeout from preferences)")
 
     _final_args, _logger = lhub_cli.common.args.build_args_and_logger(
         parser=_parser,
@@ -66,13 +66,14 @@ def main():
     fields = [x.strip() for x in args.fields.split(',') if x.strip()]
     drop_fields = [x.strip() for x in args.drop.split(',') if x.strip()]
 
+    timeouts = {k: v for k, v in {"login_timeout": args.timeout_logon, "default_timeout": args.timeout}.items() if v}
     shell = lhub_cli.LogicHubCLI(
         args.instance,
-        http_timeout_login=args.timeout_logon,
-        http_timeout_default=args.timeout
+        credentials_file_name=args.credentials_file_name,
+        **timeouts
     )
-    log.debug(f"Logon timeout: {args.timeout_logon}")
-    log.debug(f"Other HTTP timeout: {args.timeout}")
+    log.debug(f"Logon timeout: {shell.login_timeout}")
+    log.debug(f"Other HTTP timeout: {shell.session.api.http_timeout_default}")
 
     command = lhub_cli.features.commands.Command(
         session=shell.session,
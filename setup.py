@@ -15,6 +15,7 @@ setup(
         "configobj >= 5.0.6",
         "dataclasses_json >= 0.5.6",
         "rsa >= 4.8",
+        "cryptography >= 3.1",
         "requests",
         "tabulate",
         "colorama",
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import rsa
+
+from lhub_cli import encryption, session_cache
+from lhub_cli.agent import AgentClient, CredentialAgent
+from lhub_cli.connection_manager import Connection
+from lhub_cli.encryption import Encryption, EnvelopeEncryption
+from lhub_cli.session_cache import SessionCache
+
+
+class SessionReuseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+        patcher = mock.patch.object(session_cache, "LHUB_CONFIG_PATH", self.folder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Small keys keep the test fast; they are still large enough to wrap a data key
+        Encryption(self.folder, key_size=512, poolsize=1).generate_keys()
+        self.connection = Connection(name="test", hostname="lh.example.com", username="admin", password="secret")
+
+        self.socket_path = os.path.join(self.folder, "agent.sock")
+        self.agent = CredentialAgent(socket_path=self.socket_path, idle_timeout=60)
+        self.agent_thread = threading.Thread(target=self.agent.serve, daemon=True)
+        self.agent_thread.start()
+        self.addCleanup(self.agent_thread.join, 5)
+        self.client = AgentClient(self.socket_path)
+        for _ in range(100):
+            if self.client.ping():
+                break
+            threading.Event().wait(0.05)
+        self.addCleanup(self.client.stop)
+
+    def new_process_cache(self, agent=None):
+        """A SessionCache as a new process would build it, with nothing decrypted yet"""
+        encryption._KEY_CACHE.clear()
+        envelope = EnvelopeEncryption(
+            Encryption(self.folder),
+            data_key_path=os.path.join(self.folder, ".credentials.datakey")
+        )
+        return SessionCache(envelope, credentials_file_name="credentials", agent=agent)
+
+    def test_reuse_with_agent_does_not_decrypt_with_rsa(self):
+        self.new_process_cache(agent=self.client).save(self.connection, session_cookie="cookie1", server_version="m94.10")
+
+        cache = self.new_process_cache(agent=self.client)
+        with mock.patch.object(encryption.rsa, "decrypt", wraps=rsa.decrypt) as rsa_decrypt:
+            details = cache.load(self.connection)
+        self.assertEqual(details["session_cookie"], "cookie1")
+        self.assertEqual(details["server_version"], "m94.10")
+        rsa_decrypt.assert_not_called()
+
+    def test_rewritten_session_file_is_not_served_from_agent(self):
+        self.new_process_cache(agent=self.client).save(self.connection, session_cookie="cookie1", server_version="m94.10")
+        # Saved by a process which does not use the agent
+        self.new_process_cache().save(self.connection, session_cookie="cookie2", server_version="m94.10")
+
+        details = self.new_process_cache(agent=self.client).load(self.connection)
+        self.assertEqual(details["session_cookie"], "cookie2")
+
+    def test_reuse_without_agent_unwraps_data_key_once(self):
+        self.new_process_cache().save(self.connection, session_cookie="cookie1", server_version="m94.10")
+
+        cache = self.new_process_cache()
+        with mock.patch.object(encryption.rsa, "decrypt", wraps=rsa.decrypt) as rsa_decrypt:
+            self.assertEqual(cache.load(self.connection)["session_cookie"], "cookie1")
+            self.assertEqual(cache.load(self.connection)["session_cookie"], "cookie1")
+        self.assertEqual(rsa_decrypt.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()